@@ -0,0 +1,113 @@
+# مجموعة جلسات حسابات المستخدمين لتحميل المحتوى الخاص بالتوازي
+# تختار الجلسة الأقل حملا التي تملك وصولا للدردشة، وتنتقل لجلسة أخرى عند FloodWait، وتتابع صحة كل جلسة
+
+import logging
+import time
+
+from pyrogram.errors import FloodWait
+
+logger = logging.getLogger(__name__)
+
+
+# استثناء يرفع عند عدم وجود جلسة متاحة تملك وصولا للدردشة
+class NoSessionAvailable(Exception):
+    pass
+
+
+class AccountSession:
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.inflight = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.flood_until = 0.0
+        self.cooldown_until = 0.0
+        self.last_error = None
+
+    def available(self, now=None):
+        now = now or time.monotonic()
+        return now >= self.flood_until and now >= self.cooldown_until
+
+    def stats(self):
+        return {
+            "inflight": self.inflight,
+            "successes": self.successes,
+            "failures": self.failures,
+            "flooded_for": max(0.0, self.flood_until - time.monotonic()),
+            "healthy": self.available(),
+            "last_error": self.last_error,
+        }
+
+
+class AccountPool:
+    # chat_cache: لمعرفة الجلسات التي تملك وصولا للدردشة، scheduler: لمعرفة الجلسات المحظورة مؤقتا
+    # max_failures: عدد الأخطاء المتتالية قبل إيقاف الجلسة مؤقتا لمدة cooldown ثانية
+    def __init__(self, sessions, chat_cache, scheduler=None, max_failures=3, cooldown=60):
+        self.sessions = list(sessions)
+        self._chat_cache = chat_cache
+        self._scheduler = scheduler
+        self._max_failures = max_failures
+        self._cooldown = cooldown
+
+    def __bool__(self):
+        return bool(self.sessions)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    @property
+    def primary(self):
+        return self.sessions[0] if self.sessions else None
+
+    def _available(self, session):
+        if not session.available():
+            return False
+        if self._scheduler is not None and self._scheduler.blocked_for(session.client.name) > 0:
+            return False
+        return True
+
+    # اختيار الجلسة الأقل حملا التي تملك وصولا للدردشة؛ prefer تفضل الجلسة التي جلبت الرسالة مسبقا
+    async def pick(self, chatid, exclude=(), prefer=None):
+        candidates = sorted(
+            (s for s in self.sessions if s not in exclude and self._available(s)),
+            key=lambda s: s.inflight
+        )
+        if prefer in candidates and prefer.inflight <= candidates[0].inflight:
+            candidates.remove(prefer)
+            candidates.insert(0, prefer)
+        for session in candidates:
+            if await self._chat_cache.check_access(session.client, chatid):
+                return session
+        raise NoSessionAvailable(f"No available session can access chat {chatid}")
+
+    async def acquire(self, chatid, exclude=(), prefer=None):
+        session = await self.pick(chatid, exclude, prefer)
+        session.inflight += 1
+        return session
+
+    # إنهاء استخدام الجلسة وتسجيل النتيجة في حالتها الصحية
+    # neutral: لا يحسب نجاحا ولا فشلا (إلغاء أو خطأ لا يتعلق بالجلسة)
+    def release(self, session, error=None, neutral=False):
+        session.inflight -= 1
+        if neutral:
+            return
+        if error is None:
+            session.successes += 1
+            session.consecutive_failures = 0
+            return
+        session.failures += 1
+        session.last_error = str(error)
+        if isinstance(error, FloodWait):
+            session.flood_until = time.monotonic() + error.value
+            logger.warning(f"Session {session.name} flooded for {error.value} seconds")
+            return
+        session.consecutive_failures += 1
+        if session.consecutive_failures >= self._max_failures:
+            session.cooldown_until = time.monotonic() + self._cooldown
+            session.consecutive_failures = 0
+            logger.warning(f"Session {session.name} marked unhealthy for {self._cooldown} seconds: {error}")
+
+    def stats(self):
+        return {session.name: session.stats() for session in self.sessions}
@@ -0,0 +1,91 @@
+# قياس تدرج التحميل المتوازي مع عدد الاتصالات باستخدام خادم أجزاء وهمي محلي (TCP)
+# كل اتصال محدود بعرض نطاق ثابت وزمن استجابة لكل طلب، مثل جلسات GetFile في تليجرام
+# --stream-setup: تكلفة فتح كل تدفق (stream_media ينشئ جلسة جديدة، ولمركز بيانات آخر مفتاحا وتفويضا جديدين)
+# الاستخدام: python benchmarks/bench_chunked.py [--size-mb 64] [--conn-mbps 80] [--stream-setup 0.5] [--connections 1 2 4 8]
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunked import CHUNK_SIZE, download_parallel  # noqa: E402
+
+
+# خادم يستقبل "offset limit" ويرسل الأجزاء المطلوبة بمعدل محدود لكل اتصال
+async def start_server(size, conn_mbps, latency, setup=0.0):
+    rate = conn_mbps * 1_000_000 / 8
+    payload = b"\1" * CHUNK_SIZE
+
+    async def handle(reader, writer):
+        offset, limit = map(int, (await reader.readline()).split())
+        await asyncio.sleep(latency + setup)
+        for index in range(offset, offset + limit):
+            length = min(CHUNK_SIZE, size - index * CHUNK_SIZE)
+            if length <= 0:
+                break
+            await asyncio.sleep(length / rate)
+            writer.write(length.to_bytes(4, "big") + payload[:length])
+            await writer.drain()
+        writer.write((0).to_bytes(4, "big"))
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def make_fetch(port, opened):
+    async def fetch(offset, limit):
+        opened[0] += 1
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"{offset} {limit}\n".encode())
+        await writer.drain()
+        try:
+            while True:
+                length = int.from_bytes(await reader.readexactly(4), "big")
+                if not length:
+                    return
+                yield await reader.readexactly(length)
+        finally:
+            writer.close()
+    return fetch
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--conn-mbps", type=float, default=80)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--stream-setup", type=float, default=0.5)
+    parser.add_argument("--segment-chunks", type=int, default=4)
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    size = args.size_mb * CHUNK_SIZE
+    server, port = await start_server(size, args.conn_mbps, args.latency, args.stream_setup)
+    print(f"file size: {args.size_mb} MiB, per-connection {args.conn_mbps} Mbps, latency {args.latency * 1000:.0f} ms,"
+          f" stream setup {args.stream_setup * 1000:.0f} ms")
+    print(f"{'connections':>12}{'time (s)':>10}{'MiB/s':>10}{'speedup':>10}{'streams':>9}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as workdir:
+        for connections in args.connections:
+            path = os.path.join(workdir, f"out{connections}.bin")
+            start = time.perf_counter()
+            opened = [0]
+            await download_parallel(make_fetch(port, opened), size, path, connections=connections,
+                                    segment_chunks=args.segment_chunks)
+            elapsed = time.perf_counter() - start
+            assert os.path.getsize(path) == size
+            baseline = baseline or elapsed
+            print(f"{connections:>12}{elapsed:>10.2f}{args.size_mb / elapsed:>10.1f}{baseline / elapsed:>9.2f}x{opened[0]:>9}")
+            os.remove(path)
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,204 @@
+# اختبار حمل حتمي لمسار save/handle_private باستخدام خادم تليجرام وهمي (fake_telegram.py)
+# كل سيناريو يعمل في عملية مستقلة بمجلد حالة جديد حتى لا تؤثر ذاكرات التخزين بين السيناريوهات
+# يطبع لكل سيناريو: عدد الرسائل المسلمة، عدد التحميلات من المصدر، الإنتاجية، زمن التسليم p50/p99، أقصى ذاكرة وأقصى استخدام للقرص
+# الاستخدام: python benchmarks/bench_load.py [--scenario many_users large_range albums flood_storm public_copy same_link bulk_paste deleted_ids]
+#            [--scale 1.0] [--chat-rate 1.0] [--sessions 2] [--latency 0.05] [--conn-mbps 80] [--down-mbps 400] [--up-mbps 400]
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace as NS
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import fake_telegram  # noqa: E402
+from fake_telegram import FakeChat, FakeClient, FakeWorld, FloodPlan, NetworkModel  # noqa: E402
+
+SCENARIOS = ["many_users", "large_range", "albums", "flood_storm", "public_copy", "same_link", "bulk_paste", "deleted_ids"]
+
+
+# بناء العالم الوهمي وطلبات المستخدمين لكل سيناريو: قائمة (تأخير البداية، رابط)
+def build_scenario(name, scale, network):
+    count = lambda n: max(1, int(n * scale))
+    if name == "many_users":
+        world = FakeWorld(network)
+        chat = world.add_chat(FakeChat(-1001, messages=count(200) * 2))
+        media_ids = [msgid for msgid, spec in sorted(chat.messages.items()) if spec["kind"] != "text"]
+        return world, [(0.0, f"https://t.me/c/1/{msgid}") for msgid in media_ids[:count(40)]]
+    if name == "large_range":
+        world = FakeWorld(network)
+        world.add_chat(FakeChat(-1002, messages=count(100)))
+        return world, [(0.0, f"https://t.me/c/2/1-{count(100)}")]
+    if name == "albums":
+        world = FakeWorld(network)
+        world.add_chat(FakeChat(-1003, messages=count(20) * 5, album_every=5, album_size=4))
+        step = count(20)
+        return world, [(0.0, f"https://t.me/c/3/{start}-{start + step - 1}") for start in range(1, count(20) * 5, step)]
+    if name == "flood_storm":
+        floods = FloodPlan(probability=0.05, seconds=2, storm=(1.0, 4.0),
+                           methods=["get_messages", "download_media", "send_document", "send_video", "send_photo"])
+        world = FakeWorld(network, floods)
+        world.add_chat(FakeChat(-1004, messages=count(100)))
+        return world, [(0.2 * n, f"https://t.me/c/4/{n * 10 + 1}-{n * 10 + 10}") for n in range(count(10))]
+    if name == "public_copy":
+        world = FakeWorld(network)
+        world.add_chat(FakeChat(-1005, username="publicchan", protected=False, bot_member=True, messages=count(100)))
+        return world, [(0.0, f"https://t.me/publicchan/{n * 10 + 1}-{n * 10 + 10}") for n in range(count(10))]
+    if name == "same_link":
+        # مستخدمون كثيرون يرسلون نفس الروابط في نفس اللحظة (تحميل واحد لكل رسالة)
+        world = FakeWorld(network)
+        chat = world.add_chat(FakeChat(-1006, messages=count(20) * 2))
+        media_ids = [msgid for msgid, spec in sorted(chat.messages.items()) if spec["kind"] != "text"][:3]
+        return world, [(0.0, f"https://t.me/c/6/{msgid}") for msgid in media_ids for _ in range(count(20))]
+    if name == "bulk_paste":
+        # رسالة واحدة بمئات الروابط المفردة من دردشتين (تجمع حسب الدردشة وتجلب على دفعات)
+        world = FakeWorld(network)
+        world.add_chat(FakeChat(-1007, messages=count(100)))
+        world.add_chat(FakeChat(-1008, messages=count(100)))
+        links = [f"https://t.me/c/{7 + n % 2}/{n // 2 + 1}" for n in range(count(200))]
+        return world, [(0.0, "\n".join(links))]
+    if name == "deleted_ids":
+        # نطاق يمر برسائل محذوفة، ثم مستخدمون آخرون بروابط صالحة من نفس الدردشة
+        world = FakeWorld(network)
+        chat = world.add_chat(FakeChat(-1009, messages=count(40), deleted=range(3, count(40) + 1, 3)))
+        media_ids = [msgid for msgid, spec in sorted(chat.messages.items()) if spec["kind"] != "text"]
+        return world, [(0.0, f"https://t.me/c/9/1-{count(20)}")] + [(2.0, f"https://t.me/c/9/{msgid}") for msgid in media_ids[-count(5):]]
+    raise ValueError(f"Unknown scenario {name}")
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def directory_size(path):
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+# تشغيل سيناريو واحد داخل هذه العملية وإرجاع النتائج
+async def run_scenario(name, args, workdir):
+    network = NetworkModel(latency=args.latency, conn_mbps=args.conn_mbps, down_mbps=args.down_mbps,
+                           up_mbps=args.up_mbps, seed=args.seed)
+    world, requests = build_scenario(name, args.scale, network)
+    FakeClient.world = world
+
+    # الإعدادات قبل استيراد bot: عميل وهمي، مجلدات مؤقتة، وجلسات مستخدم وهمية
+    import pyrogram
+    pyrogram.Client = FakeClient
+    os.chdir(workdir)
+    with open("config.json", "w") as f:
+        json.dump({"TOKEN": "0:fake", "ID": "1", "HASH": "fake"}, f)
+    os.environ.update({
+        "STATE_DIR": os.path.join(workdir, "state"),
+        "DOWNLOAD_DIR": os.path.join(workdir, "downloads"),
+        "STRING": "session1",
+        "STRINGS": ",".join(f"session{n}" for n in range(2, args.sessions + 1)),
+        "STORAGE_MIN_FREE": "0",
+    })
+    if args.chat_rate:
+        os.environ["CHAT_RATE"] = str(args.chat_rate)
+    import bot
+    logging.getLogger().setLevel(logging.ERROR)
+
+    tracemalloc.start()
+    peak_disk = 0
+    started = {}
+
+    async def sample_disk():
+        nonlocal peak_disk
+        while True:
+            peak_disk = max(peak_disk, directory_size(bot.download_dir))
+            await asyncio.sleep(0.02)
+
+    async def user(index, delay, link):
+        await asyncio.sleep(delay)
+        message = NS(id=index + 1, chat=NS(id=5000 + index), text=link,
+                     from_user=NS(id=5000 + index, first_name=f"user{index}", mention=f"user{index}"))
+        started[message.chat.id] = time.monotonic()
+        await bot.save(None, message)
+
+    sampler = asyncio.ensure_future(sample_disk())
+    world.floods.started = time.monotonic()
+    start = time.monotonic()
+    await asyncio.gather(*(user(index, delay, link) for index, (delay, link) in enumerate(requests)))
+    elapsed = time.monotonic() - start
+    sampler.cancel()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = [at - started[chat_id] for at, chat_id, _, _, _ in world.deliveries if chat_id in started]
+    return {
+        "scenario": name,
+        "requests": len(requests),
+        "delivered": len(world.deliveries),
+        "seconds": elapsed,
+        "items_per_second": len(world.deliveries) / elapsed if elapsed else 0.0,
+        "mib_per_second": (network.down.bytes + network.up.bytes) / 2 / 1024 ** 2 / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "peak_memory_mib": peak_memory / 1024 ** 2,
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_disk_mib": peak_disk / 1024 ** 2,
+        "api_calls": sum(world.calls.values()),
+        "floods": world.floods.injected,
+        "notices": len(world.notices),
+        "paths": {k: v for (k,), v in bot.transfers_total._values.items()},
+        "downloads": world.calls.get("download_media", 0) + world.calls.get("stream_media", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--chat-rate", type=float, default=None, help="override CHAT_RATE (Telegram allows about 1/s)")
+    parser.add_argument("--sessions", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--conn-mbps", type=float, default=80)
+    parser.add_argument("--down-mbps", type=float, default=400)
+    parser.add_argument("--up-mbps", type=float, default=400)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        with tempfile.TemporaryDirectory() as workdir:
+            result = asyncio.run(run_scenario(args.run, args, workdir))
+        print(json.dumps(result))
+        return
+
+    options = [a for a in sys.argv[1:] if a not in args.scenario and a != "--scenario"]
+    print(f"{'scenario':<14}{'req':>5}{'items':>7}{'time s':>9}{'items/s':>9}{'MiB/s':>8}{'p50 s':>8}{'p99 s':>8}"
+          f"{'mem MiB':>9}{'rss MiB':>9}{'disk MiB':>9}{'calls':>7}{'dl':>5}{'floods':>7}{'notices':>8}")
+    for name in args.scenario:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", name] + options,
+                                capture_output=True, text=True)
+        lines = output.stdout.strip().splitlines()
+        if output.returncode != 0 or not lines:
+            print(f"{name:<14} failed:\n{output.stderr[-2000:]}")
+            continue
+        r = json.loads(lines[-1])
+        print(f"{name:<14}{r['requests']:>5}{r['delivered']:>7}{r['seconds']:>9.2f}{r['items_per_second']:>9.2f}"
+              f"{r['mib_per_second']:>8.1f}{r['p50']:>8.2f}{r['p99']:>8.2f}{r['peak_memory_mib']:>9.1f}"
+              f"{r['peak_rss_mib']:>9.1f}{r['peak_disk_mib']:>9.1f}{r['api_calls']:>7}{r['downloads']:>5}{r['floods']:>7}{r['notices']:>8}"
+              f"  {r['paths']}")
+
+
+if __name__ == "__main__":
+    main()
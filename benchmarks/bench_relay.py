@@ -0,0 +1,90 @@
+# مقارنة مسار القرص (تحميل كامل ثم رفع) بالنقل المباشر (relay) باستخدام عميل وهمي
+# الاستخدام: python benchmarks/bench_relay.py [--size-mb 200] [--down-mbps 400] [--up-mbps 400]
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from relay import PART_SIZE, relay  # noqa: E402
+
+CHUNK_SIZE = 1024 * 1024
+
+
+# عميل وهمي يحاكي stream_media والرفع بعرض نطاق محدد
+class FakeClient:
+    def __init__(self, size, down_mbps, up_mbps):
+        self.size = size
+        self.down_rate = down_mbps * 1_000_000 / 8
+        self.up_rate = up_mbps * 1_000_000 / 8
+
+    async def stream_media(self):
+        sent = 0
+        while sent < self.size:
+            chunk = min(CHUNK_SIZE, self.size - sent)
+            await asyncio.sleep(chunk / self.down_rate)
+            sent += chunk
+            yield b"\0" * chunk
+
+    async def upload_part(self, index, total, data):
+        await asyncio.sleep(len(data) / self.up_rate)
+
+
+# المسار الحالي: كتابة الملف كاملا على القرص ثم قراءته للرفع
+async def disk_path(client, workdir):
+    path = os.path.join(workdir, "media.bin")
+    peak_disk = 0
+    with open(path, "wb") as f:
+        async for chunk in client.stream_media():
+            f.write(chunk)
+            peak_disk = max(peak_disk, f.tell())
+    total_parts = (client.size + PART_SIZE - 1) // PART_SIZE
+    with open(path, "rb") as f:
+        index = 0
+        while True:
+            data = f.read(PART_SIZE)
+            if not data:
+                break
+            await client.upload_part(index, total_parts, data)
+            index += 1
+    os.remove(path)
+    return peak_disk
+
+
+async def relay_path(client, buffer_parts):
+    await relay(client.stream_media(), client.size, client.upload_part, buffer_parts=buffer_parts, uploaders=1)
+    return 0
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--down-mbps", type=float, default=400)
+    parser.add_argument("--up-mbps", type=float, default=400)
+    parser.add_argument("--buffer-parts", type=int, default=8)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        disk_peak = await disk_path(FakeClient(size, args.down_mbps, args.up_mbps), workdir)
+        disk_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    relay_peak = await relay_path(FakeClient(size, args.down_mbps, args.up_mbps), args.buffer_parts)
+    relay_time = time.perf_counter() - start
+    relay_memory = (args.buffer_parts + 2) * PART_SIZE + CHUNK_SIZE
+
+    print(f"file size: {args.size_mb} MiB, down {args.down_mbps} Mbps, up {args.up_mbps} Mbps")
+    print(f"{'mode':<8}{'latency (s)':>14}{'peak disk (MiB)':>18}{'buffer (MiB)':>15}")
+    print(f"{'disk':<8}{disk_time:>14.2f}{disk_peak / 2**20:>18.1f}{'-':>15}")
+    print(f"{'relay':<8}{relay_time:>14.2f}{relay_peak / 2**20:>18.1f}{relay_memory / 2**20:>15.1f}")
+    print(f"speedup: {disk_time / relay_time:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,369 @@
+# محاكاة داخلية لواجهة Pyrogram Client التي يستخدمها bot.py لقياس الأداء دون الاتصال بتليجرام
+# نموذج زمن استجابة وعرض نطاق (لكل اتصال ومشترك لكل اتجاه)، مع حقن FloodWait، وكل العشوائية من بذرة ثابتة
+# تستخدم بتبديل pyrogram.Client قبل استيراد bot (راجع bench_load.py)
+
+import asyncio
+import io
+import itertools
+import os
+import random
+import time
+from types import SimpleNamespace as NS
+
+from pyrogram import raw
+from pyrogram.errors import ChannelPrivate, FloodWait, MessageIdInvalid
+
+CHUNK_SIZE = 1024 * 1024
+
+
+# خط نقل مشترك بمعدل ثابت: كل نقل يحجز فترة زمنية بعد آخر نقل (FIFO)
+class Link:
+    def __init__(self, mbps):
+        self.rate = mbps * 1_000_000 / 8
+        self.bytes = 0
+        self._next = 0.0
+
+    # إرجاع لحظة انتهاء نقل nbytes عبر الخط
+    def reserve(self, nbytes):
+        self.bytes += nbytes
+        start = max(time.monotonic(), self._next)
+        self._next = start + nbytes / self.rate
+        return self._next
+
+
+class NetworkModel:
+    # latency: زمن كل طلب بالثواني، conn_mbps: سرعة الاتصال الواحد، down_mbps/up_mbps: سعة الخادم المشتركة
+    def __init__(self, latency=0.05, jitter=0.2, conn_mbps=80, down_mbps=400, up_mbps=400, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.conn_rate = conn_mbps * 1_000_000 / 8
+        self.down = Link(down_mbps)
+        self.up = Link(up_mbps)
+        self.random = random.Random(seed)
+
+    async def request(self):
+        await asyncio.sleep(self.latency * (1 + self.jitter * (self.random.random() * 2 - 1)))
+
+    # نقل جزء عبر اتصال واحد: الأبطأ بين حد الاتصال وحد الخط المشترك
+    async def transfer(self, link, nbytes):
+        finish = max(link.reserve(nbytes), time.monotonic() + nbytes / self.conn_rate)
+        await asyncio.sleep(max(0.0, finish - time.monotonic()))
+
+
+class FloodPlan:
+    # probability: احتمال FloodWait لكل طلب من methods، storm: فترة (بداية، نهاية) بالثواني يحظر فيها كل طلب
+    def __init__(self, probability=0.0, seconds=2, methods=None, storm=None, seed=1):
+        self.probability = probability
+        self.seconds = seconds
+        self.methods = set(methods) if methods else None
+        self.storm = storm
+        self.random = random.Random(seed)
+        self.started = time.monotonic()
+        self.injected = 0
+
+    def check(self, method):
+        if self.methods is not None and method not in self.methods:
+            return
+        elapsed = time.monotonic() - self.started
+        stormy = self.storm is not None and self.storm[0] <= elapsed < self.storm[1]
+        if stormy or (self.probability and self.random.random() < self.probability):
+            self.injected += 1
+            raise FloodWait(value=self.seconds)
+
+
+# قناة وهمية: رسائل مولدة من البذرة (نصوص ومستندات وفيديو وصور وألبومات)
+class FakeChat:
+    def __init__(self, chat_id, username=None, protected=True, bot_member=False, messages=100,
+                 media_size=(1, 8), album_every=0, album_size=4, deleted=(), seed=1):
+        self.id = chat_id
+        self.username = username
+        self.protected = protected
+        self.bot_member = bot_member
+        self.messages = {}
+        rng = random.Random(seed * 7919 + abs(chat_id))
+        msgid = 1
+        while msgid <= messages:
+            if album_every and msgid % album_every == 0:
+                group = f"{chat_id}_{msgid}"
+                for _ in range(album_size):
+                    self.messages[msgid] = self._media(msgid, rng, media_size, kind="video", group=group)
+                    msgid += 1
+                continue
+            kind = rng.choice(["text", "document", "document", "video", "photo"])
+            self.messages[msgid] = self._media(msgid, rng, media_size, kind=kind)
+            msgid += 1
+        # الرسائل المحذوفة تعاد فارغة كما في تليجرام
+        for msgid in deleted:
+            self.messages.pop(msgid, None)
+
+    def _media(self, msgid, rng, media_size, kind, group=None):
+        if kind == "text":
+            return {"kind": "text", "text": f"post {self.id}/{msgid}", "group": None}
+        size = int(rng.uniform(*media_size) * CHUNK_SIZE) if kind != "photo" else rng.randint(50, 300) * 1024
+        return {"kind": kind, "size": size, "group": group, "thumb": f"thumb_{self.id}_{msgid % 3}"}
+
+
+class FakeWorld:
+    def __init__(self, network=None, floods=None):
+        self.network = network or NetworkModel()
+        self.floods = floods or FloodPlan()
+        self.chats = {}
+        self.usernames = {}
+        self.ids = itertools.count(1_000_000)
+        self.calls = {}
+        self.deliveries = []
+        self.notices = []
+        self.sent_files = {}
+
+    def add_chat(self, chat):
+        self.chats[chat.id] = chat
+        if chat.username:
+            self.usernames[chat.username] = chat
+        return chat
+
+    def chat(self, chat_id):
+        chat = self.usernames.get(chat_id) if isinstance(chat_id, str) else self.chats.get(chat_id)
+        if chat is None:
+            raise ChannelPrivate()
+        return chat
+
+    def deliver(self, chat_id, reply_to, kind, size=0):
+        self.deliveries.append((time.monotonic(), chat_id, reply_to, kind, size))
+
+
+def _thumbs(spec):
+    return [NS(file_id=spec["thumb"], file_unique_id=spec["thumb"])] if spec.get("thumb") else None
+
+
+# بناء كائن رسالة بالحقول التي يقرأها bot.py
+def make_message(chat, msgid):
+    spec = chat.messages.get(msgid)
+    fields = dict(document=None, video=None, animation=None, sticker=None, voice=None, audio=None, photo=None, text=None)
+    # Pyrogram يعيد الرسالة المحذوفة Message(id=..., empty=True) وباقي الحقول None (بما فيها chat)
+    if spec is None:
+        return NS(id=msgid, chat=None, empty=True, media_group_id=None, has_protected_content=None,
+                  caption=None, caption_entities=None, entities=None, media=None, **fields)
+    file_id = f"src_{chat.id}_{msgid}"
+    if spec["kind"] == "text":
+        fields["text"] = spec["text"]
+    elif spec["kind"] == "photo":
+        fields["photo"] = NS(file_id=file_id, file_unique_id=file_id, file_size=spec["size"])
+    elif spec["kind"] == "video":
+        fields["video"] = NS(file_id=file_id, file_unique_id=file_id, file_size=spec["size"], file_name=f"{msgid}.mp4",
+                             mime_type="video/mp4", width=1280, height=720, duration=60, supports_streaming=True,
+                             thumbs=_thumbs(spec))
+    else:
+        fields["document"] = NS(file_id=file_id, file_unique_id=file_id, file_size=spec["size"], file_name=f"{msgid}.bin",
+                                mime_type="application/octet-stream", thumbs=_thumbs(spec))
+    return NS(id=msgid, chat=NS(id=chat.id), empty=False, media_group_id=spec["group"], has_protected_content=chat.protected,
+              caption=f"caption {msgid}" if spec["kind"] != "text" else None, caption_entities=None, entities=None,
+              media=NS(value=spec["kind"]) if spec["kind"] != "text" else None, **fields)
+
+
+class _Parser:
+    async def parse(self, text, mode=None):
+        return {"message": text, "entities": None}
+
+
+class FakeClient:
+    # العالم المشترك بين كل العملاء، يعين قبل استيراد bot
+    world = None
+
+    def __init__(self, name, bot_token=None, **kwargs):
+        self.name = name
+        self.is_bot = bot_token is not None
+        self.parser = _Parser()
+
+    # --- دورة الحياة والمعالجات ---
+    def on_message(self, *args, **kwargs):
+        return lambda func: func
+
+    def start(self):
+        return self
+
+    def stop(self):
+        return self
+
+    def rnd_id(self):
+        return next(self.world.ids)
+
+    async def _call(self, method):
+        world = self.world
+        world.calls[method] = world.calls.get(method, 0) + 1
+        await world.network.request()
+        world.floods.check(method)
+
+    def _sent(self, chat_id, kind, size):
+        file_id = f"sent_{next(self.world.ids)}"
+        self.world.sent_files[file_id] = (kind, size)
+        media = NS(file_id=file_id, file_size=size)
+        return NS(id=next(self.world.ids), chat=NS(id=chat_id), media=NS(value=kind), **{kind: media})
+
+    # --- القراءة ---
+    async def get_chat(self, chat_id):
+        await self._call("get_chat")
+        chat = self.world.chat(chat_id)
+        if self.is_bot and not chat.bot_member:
+            raise ChannelPrivate()
+        return NS(id=chat.id, username=chat.username, has_protected_content=chat.protected)
+
+    async def resolve_peer(self, chat_id):
+        return raw.types.InputPeerUser(user_id=chat_id if isinstance(chat_id, int) else 1, access_hash=0)
+
+    async def get_messages(self, chat_id, message_ids):
+        await self._call("get_messages")
+        chat = self.world.chat(chat_id)
+        if self.is_bot and not chat.bot_member and chat.username is None:
+            raise ChannelPrivate()
+        if isinstance(message_ids, int):
+            return make_message(chat, message_ids)
+        return [make_message(chat, msgid) for msgid in message_ids]
+
+    async def get_media_group(self, chat_id, message_id):
+        await self._call("get_media_group")
+        chat = self.world.chat(chat_id)
+        group = chat.messages[message_id]["group"]
+        if not group:
+            raise ValueError("The message doesn't belong to a media group")
+        return [make_message(chat, msgid) for msgid, spec in sorted(chat.messages.items()) if spec["group"] == group]
+
+    # --- التحميل ---
+    @staticmethod
+    def _media_size(message):
+        for kind in ("document", "video", "audio", "photo", "voice", "animation", "sticker"):
+            media = getattr(message, kind, None)
+            if media is not None:
+                return kind, media.file_size
+        return None, 0
+
+    async def download_media(self, message, file_name="downloads/", in_memory=False, progress=None, progress_args=()):
+        await self._call("download_media")
+        network = self.world.network
+        if isinstance(message, str):
+            size = 20 * 1024
+            await network.transfer(network.down, size)
+            data = io.BytesIO(b"\xff" * size)
+            data.name = "thumb.jpg"
+            return data
+        kind, size = self._media_size(message)
+        directory = os.path.dirname(file_name) or "downloads"
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{message.chat.id}_{message.id}_{next(self.world.ids)}.{kind}")
+        zeros = bytes(CHUNK_SIZE)
+        with open(path, "wb") as f:
+            done = 0
+            while done < size:
+                n = min(CHUNK_SIZE, size - done)
+                await network.transfer(network.down, n)
+                f.write(zeros[:n])
+                done += n
+                if progress:
+                    await progress(done, size, *progress_args)
+        return path
+
+    async def stream_media(self, message, limit=0, offset=0):
+        await self._call("stream_media")
+        network = self.world.network
+        _, size = self._media_size(message)
+        total = (size + CHUNK_SIZE - 1) // CHUNK_SIZE
+        end = min(total, offset + limit) if limit else total
+        for index in range(offset, end):
+            n = min(CHUNK_SIZE, size - index * CHUNK_SIZE)
+            await network.transfer(network.down, n)
+            yield bytes(n)
+
+    # --- الإرسال ---
+    async def _upload(self, file, progress=None, progress_args=()):
+        network = self.world.network
+        if isinstance(file, str) and file in self.world.sent_files:
+            return self.world.sent_files[file][1]
+        size = os.path.getsize(file) if isinstance(file, str) else len(file.getbuffer())
+        done = 0
+        while done < size:
+            n = min(CHUNK_SIZE, size - done)
+            await network.transfer(network.up, n)
+            done += n
+            if progress:
+                await progress(done, size, *progress_args)
+        return size
+
+    async def send_message(self, chat_id, text, reply_to_message_id=None, **kwargs):
+        await self._call("send_message")
+        if text.startswith("post "):
+            self.world.deliver(chat_id, reply_to_message_id, "text")
+        elif not text.startswith(("Downloading", "Queued", "Resuming")):
+            self.world.notices.append(text)
+        return NS(id=next(self.world.ids), chat=NS(id=chat_id), media=None)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        await self._call("edit_message_text")
+
+    async def delete_messages(self, chat_id, message_ids, **kwargs):
+        await self._call("delete_messages")
+
+    async def send_cached_media(self, chat_id, file_id, reply_to_message_id=None, **kwargs):
+        await self._call("send_cached_media")
+        kind, size = self.world.sent_files.get(file_id, ("document", 0))
+        self.world.deliver(chat_id, reply_to_message_id, "cached", 0)
+        return self._sent(chat_id, kind, size)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, reply_to_message_id=None, **kwargs):
+        await self._call("copy_message")
+        chat = self.world.chat(from_chat_id)
+        if chat.protected:
+            raise MessageIdInvalid()
+        self.world.deliver(chat_id, reply_to_message_id, "copy")
+
+    async def copy_media_group(self, chat_id, from_chat_id, message_id, reply_to_message_id=None, **kwargs):
+        await self._call("copy_media_group")
+        group = await self.get_media_group(from_chat_id, message_id)
+        if self.world.chat(from_chat_id).protected:
+            raise MessageIdInvalid()
+        for _ in group:
+            self.world.deliver(chat_id, reply_to_message_id, "copy")
+
+    def _send(kind):
+        async def send(self, chat_id, file, reply_to_message_id=None, progress=None, progress_args=(), **kwargs):
+            await self._call(f"send_{kind}")
+            size = await self._upload(file, progress, progress_args)
+            self.world.deliver(chat_id, reply_to_message_id, kind, size)
+            return self._sent(chat_id, kind, size)
+        return send
+
+    send_document = _send("document")
+    send_video = _send("video")
+    send_audio = _send("audio")
+    send_voice = _send("voice")
+    send_photo = _send("photo")
+    send_animation = _send("animation")
+    send_sticker = _send("sticker")
+    del _send
+
+    async def send_media_group(self, chat_id, media, reply_to_message_id=None, **kwargs):
+        await self._call("send_media_group")
+        sent = []
+        for item in media:
+            kind = type(item).__name__.replace("InputMedia", "").lower()
+            size = await self._upload(item.media)
+            self.world.deliver(chat_id, reply_to_message_id, kind, size)
+            sent.append(self._sent(chat_id, kind, size))
+        return sent
+
+    async def save_file(self, file, **kwargs):
+        await self._upload(file)
+        return raw.types.InputFile(id=next(self.world.ids), parts=1, name="thumb.jpg", md5_checksum="")
+
+    # طلبات raw: رفع أجزاء النقل المباشر وإرسال الوسائط المرفوعة
+    async def invoke(self, query, **kwargs):
+        name = type(query).__name__
+        await self._call(f"invoke:{name}")
+        if isinstance(query, raw.functions.upload.SaveBigFilePart):
+            await self.world.network.transfer(self.world.network.up, len(query.bytes))
+            return True
+        if isinstance(query, raw.functions.messages.SendMedia):
+            self.world.deliver(getattr(query.peer, "user_id", None), query.reply_to_msg_id, "relay")
+            return NS(updates=[], users=[], chats=[])
+        return True
+
+    async def join_chat(self, link):
+        await self._call("join_chat")
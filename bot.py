@@ -2,21 +2,35 @@
 # يستخدم مكتبة Pyrogram مع تحسينات للأداء، معالجة الأخطاء، إدارة الموارد، والأمان
 
 import pyrogram
-from pyrogram import Client, filters
+from pyrogram import Client, filters, raw, utils
 from pyrogram.errors import UserAlreadyParticipant, InviteHashExpired, UsernameNotOccupied, FloodWait
-from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
 import time
 import os
 import json
 import logging
-import speedtest
 import asyncio
+import io
+import sys
 from cachetools import TTLCache
-from concurrent.futures import ThreadPoolExecutor
-from tenacity import retry, stop_after_attempt, wait_fixed
-from aiolimiter import AsyncLimiter
-import tempfile
-import re
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_fixed
+from jobqueue import JobQueue, NoTurn, QueueFull
+from progress import ProgressBus
+from filecache import FileIdCache
+from relay import relay
+from prefetch import RangePrefetcher, batches
+from chatcache import ChatCache
+from scheduler import BULK, INTERACTIVE, RequestScheduler, current_priority
+from accounts import AccountPool, AccountSession, NoSessionAvailable
+from chunked import CHUNK_SIZE, download_parallel
+from journal import Journal
+from speedmeter import SpeedMeter
+from metrics import Registry
+from storage import InsufficientStorage, StorageManager
+from singleflight import SingleFlight
+from workqueue import WorkQueue
+from links import BOT, JOIN, PRIVATE, PUBLIC, parse_links
+from health import HealthMonitor, Watchdog
 
 # إعداد التسجيل (Logging)
 logging.basicConfig(
@@ -27,18 +41,28 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # إعداد التخزين المؤقت
-cache = TTLCache(maxsize=100, ttl=3600)  # ذاكرة تخزين مؤقتة لمدة ساعة
-
-# إعداد حوض الخيوط
-executor = ThreadPoolExecutor(max_workers=5)
-
-# إعداد الحد الأقصى للطلبات لتجنب الحظر
-limiter = AsyncLimiter(20, 60)
+cache = TTLCache(maxsize=5000, ttl=3600)  # ذاكرة تخزين مؤقتة لمدة ساعة
+media_groups = TTLCache(maxsize=1000, ttl=3600)  # مجموعات الوسائط المكتشفة أثناء الجلب على دفعات حسب الجلسة والدردشة
+message_owners = TTLCache(maxsize=5000, ttl=3600)  # جلسة المستخدم التي جلبت كل رسالة خاصة
+thumbnails = TTLCache(maxsize=2000, ttl=3600)  # بيانات الصور المصغرة حسب file_unique_id
+thumbnail_downloads = {}  # تحميلات الصور المصغرة الجارية حسب file_unique_id
+copy_modes = TTLCache(maxsize=5000, ttl=3600)  # طريقة النسخ من جهة الخادم لكل دردشة مصدر (bot أو acc أو None)
+shared_downloads = SingleFlight()  # التحميلات الجارية المشتركة بين الطلبات المتطابقة حسب chat_id:msg_id
+download_turns = {}  # أدوار الطلبات المرتبطة بكل تحميل مشترك (لأولوية حجز المساحة)
+relay_flights = {}  # عمليات النقل المباشر الجارية حسب chat_id:msg_id
+stopping = asyncio.Event()  # إيقاف البوت: عمليات النقل الملغاة تبقى في السجل لتستكمل بعد التشغيل
 
 # دالة لتحميل الإعدادات من ملف config.json أو متغيرات البيئة
 def getenv(var):
     return os.environ.get(var) or DATA.get(var, None)
 
+# دالة لقراءة إعداد على شكل قائمة (قائمة JSON أو نص مفصول بفواصل)
+def getlist(var):
+    value = getenv(var)
+    if isinstance(value, str):
+        value = value.split(",")
+    return [item.strip() for item in value or [] if item and item.strip()]
+
 # تحميل الإعدادات
 with open('config.json', 'r') as f:
     DATA = json.load(f)
@@ -47,56 +71,549 @@ bot_token = getenv("TOKEN")
 api_hash = getenv("HASH")
 api_id = getenv("ID")
 
-# إنشاء عميل البوت
-bot = Client("mybot", api_id=api_id, api_hash=api_hash, bot_token=bot_token)
-
-# إنشاء عميل المستخدم (اختياري)
-ss = getenv("STRING")
-if ss is not None:
-    acc = Client("myacc", api_id=api_id, api_hash=api_hash, session_string=ss)
-    acc.start()
-    logger.info("User session started successfully.")
-else:
-    acc = None
+# وضع التشغيل: single عملية واحدة، coordinator يستقبل الرسائل ويضعها في طابور العمل الدائم
+# و worker ينفذ النقل من الطابور بجلساته الخاصة؛ coordinator يشغل WORKERS عاملا ويعيد تشغيل من يتوقف منهم
+# (SPAWN_WORKERS=0 عند تشغيل العمال خارجيا، مع ضبط WORKERS بعددهم)
+role = getenv("ROLE") or "single"
+workers = int(getenv("WORKERS") or os.cpu_count() or 1)
+spawn_workers = (getenv("SPAWN_WORKERS") or "1") not in ("0", "false", "False")
+worker_index = int(getenv("WORKER_INDEX") or 0)
+worker_name = f"worker{worker_index}"
+worker_jobs = int(getenv("WORKER_JOBS") or 16)
+worker_poll_interval = float(getenv("WORKER_POLL_INTERVAL") or 0.5)
+
+# حدود التوازي لمهام النطاقات
+concurrency = int(getenv("CONCURRENCY") or 4)
+per_user_concurrency = int(getenv("PER_USER_CONCURRENCY") or 2)
+max_jobs_per_user = int(getenv("MAX_JOBS_PER_USER") or 3)
+max_range = int(getenv("MAX_RANGE") or 1000)  # أقصى عدد رسائل في رابط نطاق واحد
+
+# ذاكرة بيانات الدردشات (الوصول، الـ peer، أسماء المستخدمين) مع تخزين سلبي قصير
+chat_cache = ChatCache(
+    ttl=int(getenv("CHAT_CACHE_TTL") or 3600),
+    negative_ttl=int(getenv("CHAT_CACHE_NEGATIVE_TTL") or 60),
+)
+
+# مجلد الحالة الدائمة (ذاكرة file_id وغيرها)
+state_dir = getenv("STATE_DIR") or "state"
+
+# طابور العمل المشترك بين coordinator والعمال؛ العامل الذي لا يجدد عقده خلال WORK_LEASE ثانية تستلم مهامه عملية أخرى
+work_queue = WorkQueue(os.path.join(state_dir, "workqueue.sqlite3"), lease=int(getenv("WORK_LEASE") or 60)) if role != "single" else None
+
+# إعداد ذاكرة file_id الدائمة
+file_cache = FileIdCache(
+    os.path.join(state_dir, "file_ids.sqlite3"),
+    max_entries=int(getenv("FILE_CACHE_MAX_ENTRIES") or 50000),
+    max_age=int(getenv("FILE_CACHE_MAX_AGE") or 30 * 24 * 3600),
+)
+
+# سجل المهام الدائم لاستكمال العمل بعد إعادة التشغيل
+# لكل عامل سجله ومجلد تحميله حتى لا ينظف عامل ملفات عامل آخر عند بدء تشغيله
+journal = Journal(os.path.join(state_dir, worker_name if role == "worker" else "", "journal.sqlite3"))
+
+# إعداد النقل المباشر (relay) للملفات الكبيرة: الحجم الأدنى يجب أن يتجاوز 10 ميجابايت (SaveBigFilePart)
+relay_enabled = (getenv("RELAY") or "1") not in ("0", "false", "False")
+relay_min_size = max(int(getenv("RELAY_MIN_SIZE") or 20 * 1024 * 1024), 10 * 1024 * 1024 + 1)
+relay_buffer_parts = int(getenv("RELAY_BUFFER_PARTS") or 8)
+
+# السماح لجلسة المستخدم بنسخ الرسائل مباشرة إلى المستخدم عندما لا يستطيع البوت الوصول للدردشة
+# الرسالة تصل حينها من الحساب وليس من البوت، لذلك الخيار معطل افتراضيا
+acc_direct_copy = (getenv("ACC_DIRECT_COPY") or "0") not in ("0", "false", "False")
+
+# التحميل المتوازي للملفات الكبيرة عبر عدة اتصالات (كل مقطع segment_chunks ميجابايت)
+download_dir = getenv("DOWNLOAD_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads")
+if role == "worker":
+    download_dir = os.path.join(download_dir, worker_name)
+parallel_connections = int(getenv("PARALLEL_CONNECTIONS") or 4)
+parallel_min_size = int(getenv("PARALLEL_MIN_SIZE") or 64 * 1024 * 1024)
+parallel_segment_chunks = int(getenv("PARALLEL_SEGMENT_CHUNKS") or 16)
+
+# إدارة مساحة مجلد التحميل: حجز الحجم المتوقع قبل كل تحميل وانتظار المساحة بدلا من امتلاء القرص
+# الملفات الجزئية المسجلة في السجل محمية من المنظف حتى تستكمل
+storage = StorageManager(
+    download_dir,
+    quota=int(getenv("STORAGE_QUOTA") or 0),
+    min_free=int(getenv("STORAGE_MIN_FREE") or 1024 ** 3),
+    max_wait=int(getenv("STORAGE_MAX_WAIT") or 1800),
+    orphan_age=int(getenv("STORAGE_ORPHAN_AGE") or 3600),
+    protected=lambda: {t["path"] for t in journal.interrupted_transfers() if t["path"]},
+)
+storage_sweep_interval = int(getenv("STORAGE_SWEEP_INTERVAL") or 600)
+
+# إعداد طابور المهام
+job_queue = JobQueue(concurrency=concurrency, per_user=per_user_concurrency, max_jobs_per_user=max_jobs_per_user)
+
+# قياس السرعة في خيط منفصل مع حفظ النتيجة؛ SPEEDTEST_INTERVAL > 0 يفعل أخذ عينات دورية
+# تضبط حد التوازي بحيث يحصل كل نقل على TRANSFER_MBPS تقريبا (دون تجاوز CONCURRENCY)
+speed_meter = SpeedMeter(max_age=int(getenv("SPEEDTEST_MAX_AGE") or 300))
+speedtest_interval = int(getenv("SPEEDTEST_INTERVAL") or 0)
+transfer_mbps = float(getenv("TRANSFER_MBPS") or 50)
+
+# إعداد المجدول المركزي للطلبات لتجنب الحظر؛ كل طلبات bot و acc تمر عبره
+# sleep_threshold=0 يجعل Pyrogram يرفع كل FloodWait حتى يتعلم منه المجدول بدلا من النوم داخليا
+scheduler = RequestScheduler(
+    chat_rate=float(getenv("CHAT_RATE") or 1.0),
+    max_wait=int(getenv("MAX_FLOOD_WAIT") or 300),
+)
+
+# إنشاء عميل البوت؛ كل عامل يستخدم جلسة بوت خاصة به ولا يستقبل التحديثات (يستقبلها coordinator)
+# العمال يتقاسمون حدود نفس البوت، فلكل عامل جزء من معدلات الفئات (حدود كل دردشة تبقى كاملة لأن مهام المستخدم في عامل واحد)
+bot = scheduler.wrap(Client(
+    f"mybot_{worker_name}" if role == "worker" else "mybot", api_id=api_id, api_hash=api_hash, bot_token=bot_token,
+    max_concurrent_transmissions=concurrency, sleep_threshold=0, no_updates=role == "worker"
+), share=workers if role == "worker" else 1)
+
+# إعداد ناقل التقدم لتحديث رسائل الحالة
+progress_bus = ProgressBus(bot)
+
+# إنشاء جلسات المستخدم (اختياري): STRING جلسة واحدة، و STRINGS جلسات إضافية لتوزيع التحميل
+session_strings = list(dict.fromkeys(getlist("STRING") + getlist("STRINGS")))
+
+# coordinator لا ينقل شيئا؛ العمال يتقاسمون الجلسات إن كفت لكل عامل جلسة، وإلا يستخدم كل عامل كل الجلسات
+# وحينها يتقاسمون معدلاتها أيضا
+session_share = 1
+if role == "coordinator":
+    session_strings = []
+elif role == "worker" and len(session_strings) >= workers > 1:
+    session_strings = session_strings[worker_index::workers]
+elif role == "worker":
+    session_share = workers
+
+# مع أكثر من جلسة، FloodWait الطويل يرفع مبكرا لينتقل العمل إلى جلسة أخرى
+session_max_wait = int(getenv("SESSION_MAX_FLOOD_WAIT") or 30) if len(session_strings) > 1 else None
+
+sessions = []
+for index, ss in enumerate(session_strings):
+    name = "myacc" if index == 0 else f"myacc{index + 1}"
+    client = scheduler.wrap(Client(
+        name, api_id=api_id, api_hash=api_hash, session_string=ss,
+        max_concurrent_transmissions=concurrency * parallel_connections, sleep_threshold=0
+    ), max_wait=session_max_wait, share=session_share)
+    client.start()
+    sessions.append(AccountSession(name, client))
+    logger.info(f"User session {name} started successfully.")
+
+account_pool = AccountPool(sessions, chat_cache, scheduler)
+acc = account_pool.primary.client if account_pool else None
+if acc is None and role != "coordinator":
     logger.warning("String session not set; private content may not be accessible.")
 
+# مقاييس الأداء؛ METRICS_PORT يفعل نقطة HTTP و METRICS_FILE يفعل الكتابة الدورية في ملف
+metrics_host = getenv("METRICS_HOST") or "127.0.0.1"
+metrics_port = int(getenv("METRICS_PORT") or 0)
+metrics_file = getenv("METRICS_FILE")
+if role == "worker":
+    # كل عامل يعرض مقاييسه على المنفذ التالي لمنفذ coordinator حسب رقمه
+    metrics_port = metrics_port + 1 + worker_index if metrics_port else 0
+    metrics_file = f"{metrics_file}.{worker_name}" if metrics_file else None
+registry = Registry("savebot_")
+stage_seconds = registry.histogram("stage_seconds", "Time spent in each transfer stage", ["stage"])
+transfer_bytes = registry.counter("transfer_bytes_total", "Media bytes transferred", ["direction"])
+transfer_speed = registry.histogram(
+    "transfer_speed_bytes_per_second", "Throughput of individual transfers", ["direction"],
+    buckets=[2 ** n * 1024 for n in range(6, 17)]
+)
+transfers_total = registry.counter("transfers_total", "Messages delivered, by path", ["path"])
+cache_requests = registry.counter("cache_requests_total", "Cache lookups", ["cache", "result"])
+cache_hit_ratio = registry.gauge("cache_hit_ratio", "Cache hit ratio since start", ["cache"])
+queue_depth = registry.gauge("queue_depth", "Range items not finished yet")
+active_jobs = registry.gauge("active_jobs", "Range jobs in progress")
+job_concurrency = registry.gauge("job_concurrency", "Global limit of concurrent transfers")
+scheduler_queued = registry.gauge("scheduler_queued", "Requests waiting for a scheduler budget", ["budget"])
+scheduler_rate = registry.gauge("scheduler_rate", "Current scheduler budget rate (requests/s)", ["budget"])
+flood_waits = registry.counter("flood_waits_total", "FloodWait errors", ["method"])
+flood_wait_seconds = registry.counter("flood_wait_seconds_total", "Seconds of FloodWait received", ["method"])
+session_inflight = registry.gauge("session_inflight", "Transfers in flight per user session", ["session"])
+session_healthy = registry.gauge("session_healthy", "Whether a user session is accepting work", ["session"])
+storage_usage = registry.gauge("storage", "Download directory usage (bytes, files, reservations)", ["kind"])
+work_items = registry.gauge("work_items", "Shared work queue items by status", ["status"])
+loop_lag = registry.gauge("event_loop_lag_seconds", "Event loop lag measured by the health monitor")
+watchdog_restarts = registry.counter("watchdog_restarts_total", "Stalled transfers restarted by the watchdog")
+
+# تحديث المقاييس اللحظية من حالة المكونات عند كل طلب للمقاييس
+@registry.collector
+def collect_state():
+    queue_depth.set(job_queue.depth())
+    active_jobs.set(len(job_queue.active_jobs()))
+    job_concurrency.set(job_queue.concurrency)
+    stats = scheduler.stats()
+    for name, value in stats["queued"].items():
+        scheduler_queued.set(value, budget=name)
+    for name, value in stats["rates"].items():
+        scheduler_rate.set(value, budget=name)
+    for method, value in stats["flood_counts"].items():
+        flood_waits.set(value, method=method)
+    for method, value in stats["flood_seconds"].items():
+        flood_wait_seconds.set(value, method=method)
+    for name, session in account_pool.stats().items():
+        session_inflight.set(session["inflight"], session=name)
+        session_healthy.set(int(session["healthy"]), session=name)
+    for kind, value in storage.usage().items():
+        storage_usage.set(value, kind=kind)
+    if work_queue is not None:
+        for status, value in work_queue.counts().items():
+            work_items.set(value, status=status)
+    for name, cache_stats in (("file_id", file_cache.stats()), ("chat", chat_cache.stats())):
+        cache_requests.set(cache_stats["hits"], cache=name, result="hit")
+        cache_requests.set(cache_stats["misses"], cache=name, result="miss")
+    for name in ("message", "file_id", "chat", "thumbnail", "inflight"):
+        hits = cache_requests.value(cache=name, result="hit")
+        misses = cache_requests.value(cache=name, result="miss")
+        cache_hit_ratio.set(hits / (hits + misses) if hits + misses else 0.0, cache=name)
+    loop_lag.set(health_monitor.lag)
+    watchdog_restarts.set(watchdog.restarts)
+
+# مراقب النقل: يعيد تشغيل النقل الذي لم يتقدم منذ STALL_TIMEOUT ثانية، وبعد توقف حلقة الأحداث
+# لأكثر من LOOP_STALL ثانية يعيد ما لم يستأنف خلال STALL_GRACE ثانية؛ MAX_TRANSFER_RESTARTS لكل رسالة
+watchdog = Watchdog(
+    progress_bus.stalled,
+    timeout=int(getenv("STALL_TIMEOUT") or 300),
+    grace=int(getenv("STALL_GRACE") or 30),
+)
+max_transfer_restarts = int(getenv("MAX_TRANSFER_RESTARTS") or 2)
+
+# مراقبة الصحة: تقرير إلى HEALTH_CHAT_ID عند تغير الحالة أو استمرار مشكلة (بفواصل تبدأ من HEALTH_BACKOFF)
+# وحالة JSON على /health في نقطة المقاييس؛ HEALTH_MAX_LAG و HEALTH_MAX_QUEUE حدود التنبيه
+health_chat_id = getenv("HEALTH_CHAT_ID")
+health_max_lag = float(getenv("HEALTH_MAX_LAG") or 1.0)
+health_max_queue = int(getenv("HEALTH_MAX_QUEUE") or 1000)
+
+# حالة المكونات التي يقيسها مراقب الصحة
+def health_state():
+    sessions = account_pool.stats().values()
+    return {
+        "role": role if role != "worker" else f"worker {worker_name}",
+        "active_jobs": len(job_queue.active_jobs()),
+        "queue_depth": job_queue.depth(),
+        "transfers": len(progress_bus.snapshot()),
+        "transferred_bytes": transfer_bytes.value(direction="down") + transfer_bytes.value(direction="up"),
+        "watchdog_restarts": watchdog.restarts,
+        "bot_flood_wait": max(0.0, scheduler.blocked_for(bot.name)),
+        "sessions": len(sessions),
+        "sessions_healthy": sum(1 for session in sessions if session["healthy"]),
+        "sessions_flooded": sum(1 for session in sessions if session["flooded_for"] > 0),
+        "disk_headroom": storage.headroom(),
+        "work_queue": work_queue.counts() if work_queue is not None else None,
+    }
+
+# المشاكل الحالية حسب الحدود؛ الاسم يحدد تغير الحالة والوصف يظهر في التقرير
+def health_problems(state):
+    problems = {}
+    if state["loop_lag"] > health_max_lag:
+        problems["loop_lag"] = f"Event loop lag {state['loop_lag']:.2f}s"
+    if state["bot_flood_wait"] > 0:
+        problems["bot_flood_wait"] = f"Bot is rate limited for {state['bot_flood_wait']:.0f}s"
+    if state["sessions"] and not state["sessions_healthy"]:
+        problems["sessions"] = f"No user session available ({state['sessions_flooded']} in FloodWait)"
+    if role != "coordinator" and state["disk_headroom"] < storage.min_free:
+        problems["disk"] = f"Low disk headroom: {state['disk_headroom'] / 1024 ** 3:.1f} GiB"
+    if state["queue_depth"] > health_max_queue:
+        problems["queue"] = f"{state['queue_depth']} items queued"
+    if state["watchdog_restarts_per_second"] > 0:
+        problems["stalled"] = "Stalled transfers were restarted recently"
+    return problems
+
+# ملخص الحالة في نص التقرير
+def describe_health(report):
+    lines = [
+        f"Role: {report['role']}, uptime: {report['uptime'] / 3600:.1f}h",
+        f"Jobs: {report['active_jobs']} active, {report['queue_depth']} queued, {report['transfers']} transfers",
+        f"Throughput: {report['transferred_bytes_per_second'] / 1024 ** 2:.2f} MiB/s",
+        f"Disk headroom: {report['disk_headroom'] / 1024 ** 3:.1f} GiB",
+    ]
+    if report["work_queue"] is not None:
+        lines.append(f"Work queue: {report['work_queue']}")
+    return "\n".join(lines)
+
+async def send_health_report(text):
+    await bot.send_message(int(health_chat_id), text)
+
+health_monitor = HealthMonitor(
+    health_state, health_problems,
+    notify=send_health_report if health_chat_id else None,
+    describe=describe_health,
+    interval=int(getenv("HEALTH_INTERVAL") or 15),
+    stall_lag=float(getenv("LOOP_STALL") or 10),
+    on_stall=watchdog.on_loop_stall,
+    rate_keys=("transferred_bytes", "watchdog_restarts"),
+    backoff=int(getenv("HEALTH_BACKOFF") or 600),
+)
+
+# تسجيل حجم وسرعة نقل واحد
+def record_transfer(direction, size, elapsed):
+    transfer_bytes.inc(size, direction=direction)
+    if elapsed > 0:
+        transfer_speed.observe(size / elapsed, direction=direction)
+
 # دالة لجلب الرسائل مع التخزين المؤقت
+# المفتاح يشمل اسم العميل لأن الرسالة المجلوبة بحساب لا تصلح للتحميل بحساب آخر
 async def get_cached_message(client, chatid, msgid):
-    key = f"{chatid}:{msgid}"
+    key = f"{client.name}:{chatid}:{msgid}"
     if key in cache:
+        cache_requests.inc(cache="message", result="hit")
         logger.info(f"Retrieved message {msgid} from cache")
         return cache[key]
+    cache_requests.inc(cache="message", result="miss")
     msg = await client.get_messages(chatid, msgid)
     cache[key] = msg
     logger.info(f"Cached message {msgid} for chat {chatid}")
     return msg
 
-# دالة لإدارة التأخير لتجنب الحظر
-async def rate_limited_sleep():
-    async with limiter:
-        await asyncio.sleep(0.1)
+# دالة لجلب عدة رسائل على دفعات (حتى 200 معرف في الاستدعاء) مع التخزين المؤقت
+async def get_cached_messages(client, chatid, msgids):
+    missing = [msgid for msgid in msgids if f"{client.name}:{chatid}:{msgid}" not in cache]
+    cache_requests.inc(len(msgids) - len(missing), cache="message", result="hit")
+    cache_requests.inc(len(missing), cache="message", result="miss")
+    for batch in batches(missing):
+        msgs = await client.get_messages(chatid, batch)
+        for msg in msgs:
+            cache[f"{client.name}:{chatid}:{msg.id}"] = msg
+        index_media_groups(client, batch, msgs)
+        logger.info(f"Cached {len(batch)} messages for chat {chatid} in one request")
+    return [cache.get(f"{client.name}:{chatid}:{msgid}") for msgid in msgids]
 
-# دالة للتحقق من صحة روابط تليجرام
-def is_valid_telegram_link(link):
-    # نمط regex لدعم روابط الرسائل (عامة وخاصة) وروابط الدعوة
-    pattern = r'^https://t\.me/(c/\d+/\d+|b/\w+/\d+|\+\w+|\w+/\d+)$'
-    return bool(re.match(pattern, link))
+# دالة لجلب دفعة رسائل خاصة بالجلسة الأقل حملا وتسجيلها كمالكة لهذه الرسائل
+async def prefetch_private(chatid, msgids):
+    session = await account_pool.pick(chatid)
+    await get_cached_messages(session.client, chatid, msgids)
+    for msgid in msgids:
+        message_owners[f"{chatid}:{msgid}"] = session
 
-# دالة للتحقق من إذن الوصول
-async def check_chat_access(client, chatid):
+# دالة لتسجيل مجموعات الوسائط المكتملة داخل دفعة معرفات متتالية
+# المجموعة تعتبر مكتملة إذا كانت الرسائل المجاورة لها داخل الدفعة وليست منها
+# المفتاح يشمل اسم الجلسة لأن رسائل جلسة لا تحملها جلسة أخرى (كما في ذاكرة الرسائل)
+def index_media_groups(client, batch, msgs):
+    groups = {}
+    for msg in msgs:
+        if not msg.empty and msg.media_group_id:
+            groups.setdefault((msg.chat.id, msg.media_group_id), []).append(msg)
+    first, last = min(batch), max(batch)
+    for (chat_id, group_id), members in groups.items():
+        ids = [m.id for m in members]
+        if min(ids) > first and max(ids) < last and len(ids) == max(ids) - min(ids) + 1:
+            media_groups[f"{client.name}:{chat_id}:{group_id}"] = sorted(members, key=lambda m: m.id)
+
+# دالة لجلب مجموعة وسائط من الذاكرة إن كانت مكتشفة مسبقا
+async def get_cached_media_group(client, chatid, msgid):
+    msg = await get_cached_message(client, chatid, msgid)
+    group = media_groups.get(f"{client.name}:{msg.chat.id}:{msg.media_group_id}")
+    if group is not None:
+        logger.info(f"Retrieved media group {msg.media_group_id} from cache")
+        return group
+    return await client.get_media_group(chatid, msgid)
+
+# دالة لتحميل الوسائط مع التدفق وإعادة المحاولة
+# FloodWait لا يعاد محاولته هنا بل يرفع لينتقل العمل إلى جلسة أخرى
+@retry(stop=stop_after_attempt(3), wait=wait_fixed(5), retry=retry_if_not_exception_type(FloodWait), reraise=True)
+async def download_media_stream(client, message, progress_callback, progress_args):
+    logger.info(f"Downloading media for message {message.id}")
+    return await client.download_media(
+        message, file_name=os.path.join(download_dir, ""), in_memory=False,
+        progress=progress_callback, progress_args=progress_args
+    )
+
+async def download_thumbnail(client, thumb):
+    try:
+        with stage_seconds.time(stage="thumb_download"):
+            data = (await client.download_media(thumb.file_id, in_memory=True)).getvalue()
+        thumbnails[thumb.file_unique_id] = data
+        return data
+    finally:
+        thumbnail_downloads.pop(thumb.file_unique_id, None)
+
+# دالة لجلب الصورة المصغرة في الذاكرة؛ تعيد BytesIO جديدا في كل مرة لأن الرفع يستهلكه
+# الصورة المصغرة اختيارية، فأي خطأ يعيد None بدلا من تأخير الرسالة بإعادة المحاولة
+async def fetch_thumbnail(client, msg, msg_type):
+    media = getattr(msg, msg_type.lower(), None)
+    if msg_type not in ("Document", "Video", "Audio") or not getattr(media, "thumbs", None):
+        return None
+    thumb = media.thumbs[0]
+    data = thumbnails.get(thumb.file_unique_id)
+    if data is None:
+        cache_requests.inc(cache="thumbnail", result="miss")
+        # عناصر الألبوم كثيرا ما تشترك في نفس الصورة المصغرة، فتنتظر نفس التحميل
+        task = thumbnail_downloads.get(thumb.file_unique_id)
+        if task is None:
+            task = asyncio.ensure_future(download_thumbnail(client, thumb))
+            thumbnail_downloads[thumb.file_unique_id] = task
+        try:
+            data = await asyncio.shield(task)
+        except Exception as e:
+            logger.warning(f"Failed to download thumbnail for message {msg.id}: {e}")
+            return None
+    else:
+        cache_requests.inc(cache="thumbnail", result="hit")
+    file = io.BytesIO(data)
+    file.name = "thumb.jpg"
+    return file
+
+# دالة لإعادة إرسال وسائط سبق رفعها باستخدام file_id المخزن
+async def send_cached_file(message, msg, media_type, file_id):
     try:
-        chat = await client.get_chat(chatid)
-        logger.info(f"Access verified for chat {chatid}: {chat.title}")
+        await bot.send_cached_media(
+            message.chat.id, file_id, caption=msg.caption or "", caption_entities=msg.caption_entities,
+            reply_to_message_id=message.id
+        )
+        logger.info(f"Sent cached {media_type} for message {msg.id} from chat {msg.chat.id}")
         return True
     except Exception as e:
-        logger.error(f"Cannot access chat {chatid}: {str(e)}")
+        logger.warning(f"Cached file_id for {msg.chat.id}:{msg.id} was rejected, falling back to download: {e}")
+        file_cache.delete(msg.chat.id, msg.id)
         return False
 
-# دالة لتحميل الوسائط مع التدفق وإعادة المحاولة
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(5))
-async def download_media_stream(client, message, progress_callback, progress_args):
-    logger.info(f"Downloading media for message {message.id}")
-    return await client.download_media(message, in_memory=False, progress=progress_callback, progress_args=progress_args)
+# دالة لحفظ file_id الذي أعاده تليجرام بعد الرفع
+def remember_file_id(msg, sent):
+    if sent is None or sent.media is None:
+        return
+    media = getattr(sent, sent.media.value, None)
+    if media is None or not getattr(media, "file_id", None):
+        return
+    file_cache.put(msg.chat.id, msg.id, sent.media.value, media.file_id, getattr(media, "file_size", None))
+
+# دالة لتحديد إمكانية نسخ رسائل الدردشة من جهة الخادم دون تحميل، مع حفظ القرار لكل دردشة
+# "bot": البوت عضو في الدردشة، "acc": جلسة المستخدم تنسخ مباشرة للمستخدم، None: يجب التحميل
+async def copy_mode(msg):
+    chat_id = msg.chat.id
+    if chat_id in copy_modes:
+        return copy_modes[chat_id]
+    if msg.has_protected_content:
+        mode = None
+    elif await chat_cache.check_access(bot, chat_id):
+        mode = "bot"
+    elif acc_direct_copy:
+        mode = "acc"
+    else:
+        mode = None
+    copy_modes[chat_id] = mode
+    logger.info(f"Server-side copy mode for chat {chat_id}: {mode}")
+    return mode
+
+# دالة لنسخ رسالة أو ألبوم من جهة الخادم إن أمكن؛ تعيد True عند النجاح
+# client: الجلسة التي جلبت الرسالة (تستخدم في وضع acc)
+async def try_server_copy(client, message, msg, turn, album=False):
+    if msg.empty:
+        return False
+    mode = await copy_mode(msg)
+    if mode is None:
+        return False
+    await turn.wait()
+    try:
+        if mode == "bot":
+            copy = bot.copy_media_group if album else bot.copy_message
+            await copy(message.chat.id, msg.chat.id, msg.id, reply_to_message_id=message.id)
+        else:
+            copy = client.copy_media_group if album else client.copy_message
+            await copy(message.from_user.id, msg.chat.id, msg.id)
+    except FloodWait:
+        raise
+    except Exception as e:
+        logger.warning(f"Server-side copy of {msg.id} from chat {msg.chat.id} failed, downloading instead: {e}")
+        copy_modes[msg.chat.id] = None
+        return False
+    transfers_total.inc(path="copy")
+    logger.info(f"Copied {'media group' if album else 'message'} {msg.id} from chat {msg.chat.id} server-side ({mode})")
+    return True
+
+# دالة لتحديد إمكانية النقل المباشر؛ الأنواع التي تحتاج ملفا قابلا للتنقل أو صورة مصغرة تمر عبر القرص
+# الملفات التي تتجاوز حد التحميل المتوازي تحمل عبر عدة اتصالات بدلا من النقل المباشر باتصال واحد
+def can_relay(msg, msg_type):
+    if not relay_enabled or msg_type not in ("Document", "Video"):
+        return False
+    media = getattr(msg, msg_type.lower())
+    return bool(media.file_size) and relay_min_size <= media.file_size and not use_parallel_download(media.file_size)
+
+# دالة لتحديد استخدام التحميل المتوازي حسب حجم الملف
+def use_parallel_download(size):
+    return parallel_connections > 1 and bool(size) and size >= parallel_min_size
+
+# دالة لتحميل وسائط الرسالة: الملفات الكبيرة عبر عدة اتصالات متوازية والباقي بالتحميل العادي
+# source يحدد عملية النقل في السجل؛ المقاطع المكتملة قبل إعادة التشغيل لا يعاد تحميلها
+# reservation: حجز المساحة الخاص بالملف، يربط بمسار الملف حتى يحسب ما كتب منه
+# progress(current, total): بديل اختياري لتحديث رسالة الحالة (مثلا لتجميع تقدم عناصر الألبوم)
+async def download_message_media(client, msg, msg_type, smsg, source, reservation=None, progress=None):
+    media = getattr(msg, msg_type.lower(), None)
+    size = getattr(media, "file_size", None)
+
+    async def on_progress(current, total):
+        await progress_bus.callback(current, total, status_key(smsg), "down")
+
+    progress = progress or on_progress
+    if not use_parallel_download(size):
+        return await download_media_stream(client, msg, progress, [])
+
+    file_name = getattr(media, "file_name", None) or f"{msg_type.lower()}_{msg.id}"
+    path = os.path.join(download_dir, f"{source.replace(':', '_')}_{file_name}")
+    done = journal.transfer_segments(source, path)
+    journal.transfer_file(source, path, size)
+    if reservation is not None:
+        reservation.path = path
+    segment_size = parallel_segment_chunks * CHUNK_SIZE
+
+    def on_segment(index):
+        journal.segment_done(source, index, min(segment_size, size - index * segment_size))
+
+    logger.info(f"Downloading media for message {msg.id} over {parallel_connections} connections ({size} bytes, {len(done)} segments already done)")
+    try:
+        return await download_parallel(
+            lambda offset, limit: client.stream_media(msg, limit=limit, offset=offset), size, path,
+            connections=parallel_connections, segment_chunks=parallel_segment_chunks, progress=progress,
+            should_retry=lambda e: not isinstance(e, FloodWait), done=done, on_segment=on_segment
+        )
+    except BaseException as e:
+        # الملف الجزئي يبقى للاستكمال ما دام سجله يحفظ مقاطعه المكتملة (إيقاف البوت أو إعادة تشغيل المراقب)
+        # ويحذف عند الفشل أو بعد إلغاء المستخدم الذي يحذف سجل النقل
+        if not isinstance(e, asyncio.CancelledError) or not journal.transfer_segments(source, path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+
+# دالة لنقل المستند أو الفيديو من acc إلى البوت جزءا بجزء؛ تعيد الوسائط المرفوعة جاهزة للإرسال
+# thumb_task: مهمة جلب الصورة المصغرة التي تعمل بالتوازي مع النقل
+async def relay_upload(client, msg, msg_type, smsg, thumb_task=None):
+    media = getattr(msg, msg_type.lower())
+    file_id = bot.rnd_id()
+
+    async def upload_part(index, total, data):
+        await bot.invoke(raw.functions.upload.SaveBigFilePart(
+            file_id=file_id, file_part=index, file_total_parts=total, bytes=data
+        ))
+
+    async def on_progress(done, total):
+        await progress_bus.callback(done, total, status_key(smsg), "up")
+
+    logger.info(f"Relaying media for message {msg.id} ({media.file_size} bytes)")
+    parts = await relay(client.stream_media(msg), media.file_size, upload_part, buffer_parts=relay_buffer_parts, progress=on_progress)
+
+    file_name = getattr(media, "file_name", None) or f"{msg_type.lower()}_{msg.id}"
+    attributes = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+    if msg_type == "Video":
+        attributes.append(raw.types.DocumentAttributeVideo(
+            duration=media.duration, w=media.width, h=media.height, supports_streaming=media.supports_streaming or None
+        ))
+    thumb = await thumb_task if thumb_task is not None else None
+    return raw.types.InputMediaUploadedDocument(
+        file=raw.types.InputFileBig(id=file_id, parts=parts, name=file_name),
+        mime_type=media.mime_type or "application/octet-stream",
+        attributes=attributes,
+        thumb=await bot.save_file(thumb) if thumb else None
+    )
+
+# دالة لإرسال وسائط مرفوعة مسبقا وإرجاع الرسالة المرسلة
+async def send_uploaded_media(message, msg, media):
+    r = await bot.invoke(raw.functions.messages.SendMedia(
+        peer=await chat_cache.resolve_peer(bot, message.chat.id),
+        media=media,
+        reply_to_msg_id=message.id,
+        random_id=bot.rnd_id(),
+        **await utils.parse_text_entities(bot, msg.caption or "", None, msg.caption_entities)
+    ))
+    for update in r.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await pyrogram.types.Message._parse(
+                bot, update.message, {u.id: u for u in r.users}, {c.id: c for c in r.chats}
+            )
 
 # دالة للانضمام إلى الدردشات مع معالجة FloodWait
 async def join_chat_with_retry(client, link):
@@ -105,80 +622,209 @@ async def join_chat_with_retry(client, link):
         logger.info(f"Joined chat via link: {link}")
         return True
     except FloodWait as e:
-        logger.warning(f"FloodWait error, waiting for {e.x} seconds")
-        await asyncio.sleep(e.x)
+        logger.warning(f"FloodWait error, waiting for {e.value} seconds")
+        await asyncio.sleep(e.value)
         return False
     except Exception as e:
         logger.error(f"Error joining chat: {e}")
         raise
 
-# دالة لتحديث حالة التحميل
-async def downstatus(statusfile, message):
-    while not os.path.exists(statusfile):
-        await asyncio.sleep(1)
-    await asyncio.sleep(3)
-    while os.path.exists(statusfile):
+# دالة لانضمام باقي جلسات المستخدم إلى الدردشة حتى تشارك في التحميل منها
+async def join_other_sessions(link):
+    for session in account_pool.sessions[1:]:
         try:
-            with open(statusfile, "r") as downread:
-                txt = downread.read()
-            await bot.edit_message_text(message.chat.id, message.id, f"Downloaded: **{txt}**")
-            await asyncio.sleep(10)
-        except Exception as e:
-            logger.error(f"Error editing download status message: {e}")
-            await asyncio.sleep(5)
-
-# دالة لتحديث حالة الرفع
-async def upstatus(statusfile, message):
-    while not os.path.exists(statusfile):
-        await asyncio.sleep(1)
-    await asyncio.sleep(3)
-    while os.path.exists(statusfile):
-        try:
-            with open(statusfile, "r") as upread:
-                txt = upread.read()
-            await bot.edit_message_text(message.chat.id, message.id, f"Uploaded: **{txt}**")
-            await asyncio.sleep(10)
+            await session.client.join_chat(link)
+            logger.info(f"Session {session.name} joined chat via link: {link}")
+        except UserAlreadyParticipant:
+            pass
         except Exception as e:
-            logger.error(f"Error editing upload status message: {e}")
-            await asyncio.sleep(5)
-
-# دالة لكتابة تقدم التحميل/الرفع إلى ملف مؤقت
-def progress(current, total, message, type):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=f"{type}status.txt") as fileup:
-        fileup.write(f"{current * 100 / total:.1f}%".encode())
-        return fileup.name
+            logger.warning(f"Session {session.name} could not join chat: {e}")
 
 # دالة لقياس سرعة الإنترنت
+# القياس يجري في خيط منفصل، والطلبات المتزامنة تنتظر نفس القياس، والنتيجة الحديثة ترسل مباشرة
 async def speedtest_command(client, message):
     try:
-        await message.reply_text("جاري قياس سرعة الانترنت، يرجى الانتظار...")
-        st = speedtest.Speedtest()
-        st.get_best_server()
-        download_speed = st.download() / 1_000_000  # ميجابت بالثانية
-        upload_speed = st.upload() / 1_000_000      # ميجابت بالثانية
-        ping = st.results.ping
+        if not speed_meter.fresh():
+            await bot.send_message(message.chat.id, "جاري قياس سرعة الانترنت، يرجى الانتظار...", reply_to_message_id=message.id)
+        result = await speed_meter.measure()
 
         result_message = (
-            f"سرعة التحميل: {download_speed:.2f} Mbps\n"
-            f"سرعة الرفع: {upload_speed:.2f} Mbps\n"
-            f"البينغ: {ping:.2f} ms"
+            f"سرعة التحميل: {result.download:.2f} Mbps\n"
+            f"سرعة الرفع: {result.upload:.2f} Mbps\n"
+            f"البينغ: {result.ping:.2f} ms"
         )
-        await message.reply_text(result_message)
+        if result.age() >= 60:
+            result_message += f"\n(قبل {int(result.age() // 60)} دقيقة)"
+        await bot.send_message(message.chat.id, result_message, reply_to_message_id=message.id)
         logger.info(f"Speedtest completed for user {message.from_user.id}")
     except Exception as e:
         logger.error(f"Speedtest error: {e}")
-        await message.reply_text(f"Sorry, an error occurred while measuring speed: {str(e)}. Please try again.")
+        await bot.send_message(message.chat.id, f"Sorry, an error occurred while measuring speed: {str(e)}. Please try again.", reply_to_message_id=message.id)
+
+# دالة لمعالجة مجموعات الوسائط كوحدة واحدة
+# النسخ المباشر بالبوت أولا (copy=True) إن لم يكن المحتوى محميا، وإلا النقل عبر جلسة مستخدم في رسالة واحدة
+async def handle_media_group(message, chatid, msgid, turn=None, copy=True):
+    turn = turn or NoTurn()
+    if copy:
+        try:
+            msg = await get_cached_message(bot, chatid, msgid)
+            if not msg.has_protected_content:
+                await turn.wait()
+                await bot.copy_media_group(message.chat.id, msg.chat.id, msg.id, reply_to_message_id=message.id)
+                transfers_total.inc(path="copy")
+                logger.info(f"Copied media group {msg.media_group_id} from chat {chatid}")
+                return
+        except Exception as e:
+            logger.warning(f"Copying media group {msgid} from chat {chatid} failed, transferring instead: {e}")
+
+    if acc is None:
+        async with turn:
+            await bot.send_message(
+                message.chat.id,
+                "Sorry, the string session is not set. Please configure it to access private content.",
+                reply_to_message_id=message.id
+            )
+        return
+    start_time = time.time()
+    await run_with_session(
+        message, chatid, msgid, turn,
+        lambda client: transfer_album(client, message, chatid, msgid, turn, start_time)
+    )
+
+# وصف عنصر ألبوم لـ send_media_group؛ media مسار ملف محمل أو file_id مخزن
+def album_input_media(media_type, media, msg, thumb=None):
+    kwargs = dict(media=media, caption=msg.caption or "", caption_entities=msg.caption_entities)
+    source = getattr(msg, media_type, None)
+    if media_type == "photo":
+        return InputMediaPhoto(**kwargs)
+    if media_type == "video":
+        return InputMediaVideo(
+            **kwargs, thumb=thumb, width=getattr(source, "width", 0) or 0, height=getattr(source, "height", 0) or 0,
+            duration=getattr(source, "duration", 0) or 0, supports_streaming=bool(getattr(source, "supports_streaming", True))
+        )
+    if media_type == "audio":
+        return InputMediaAudio(
+            **kwargs, thumb=thumb, duration=getattr(source, "duration", 0) or 0,
+            performer=getattr(source, "performer", None), title=getattr(source, "title", None)
+        )
+    return InputMediaDocument(**kwargs, thumb=thumb)
+
+# دالة لنقل ألبوم كامل: تحميل كل العناصر بالتوازي مع رسالة حالة واحدة ثم إرسالها في استدعاء واحد
+# العناصر المحفوظة في ذاكرة file_id لا يعاد تحميلها
+async def transfer_album(client, message, chatid, msgid, turn, start_time):
+    try:
+        with stage_seconds.time(stage="fetch"):
+            group = await get_cached_media_group(client, chatid, msgid)
+    except FloodWait:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to retrieve media group {msgid} from chat {chatid}: {e}")
+        chat_cache.invalidate(client, chatid)
+        async with turn:
+            await bot.send_message(message.chat.id, f"Failed to retrieve media group: {str(e)}", reply_to_message_id=message.id)
+        return e
+
+    if await try_server_copy(client, message, group[0], turn, album=True):
+        return
 
-# دالة لمعالجة مجموعات الوسائط
-async def handle_media_group(client, message, chatid, msgid):
+    media = [None] * len(group)
+    pending = []
+    for index, item in enumerate(group):
+        cached = file_cache.get(item.chat.id, item.id)
+        if cached is not None:
+            media[index] = album_input_media(cached[0], cached[1], item)
+        else:
+            pending.append(index)
+
+    smsg = None
+    files, reservations, sources, failed = [], [], [], []
     try:
-        media_group = await client.get_media_group(chatid, msgid)
-        for media in media_group:
-            await handle_private(message, chatid, media.id)
-        logger.info(f"Processed media group {msgid} from chat {chatid}")
+        if pending:
+            smsg = await bot.send_message(message.chat.id, f"Downloading album ({len(pending)} files)", reply_to_message_id=message.id)
+            progress_bus.watch(smsg.chat.id, smsg.id)
+            watchdog.watch(status_key(smsg))
+            sizes = {index: getattr(getattr(group[index], get_message_type(group[index]).lower(), None), "file_size", 0) or 0 for index in pending}
+            received = dict.fromkeys(pending, 0)
+
+            # تحميل عنصر واحد مع جلب صورته المصغرة بالتوازي
+            async def download_item(index):
+                item = group[index]
+                msg_type = get_message_type(item)
+                source = f"{message.chat.id}:{chatid}:{item.id}"
+                sources.append(source)
+                journal.transfer_begin(source, smsg.chat.id, smsg.id)
+                thumb_task = asyncio.ensure_future(fetch_thumbnail(client, item, msg_type))
+
+                async def on_progress(current, total):
+                    received[index] = current
+                    await progress_bus.callback(sum(received.values()), sum(sizes.values()), status_key(smsg), "down")
+
+                try:
+                    reservation = await storage.reserve(sizes[index], source, is_head=turn.is_head)
+                    reservations.append(reservation)
+                    download_start = time.perf_counter()
+                    with stage_seconds.time(stage="download"):
+                        file = await download_message_media(client, item, msg_type, smsg, source, reservation, on_progress)
+                    files.append(file)
+                    reservation.path = file
+                    record_transfer("down", os.path.getsize(file), time.perf_counter() - download_start)
+                    media[index] = album_input_media(msg_type.lower(), file, item, await thumb_task)
+                except FloodWait:
+                    raise
+                except Exception as e:
+                    logger.error(f"Failed to download album item {item.id}: {e}")
+                    failed.append(item.id)
+                finally:
+                    thumb_task.cancel()
+
+            # خطأ FloodWait في أي عنصر يوقف باقي العناصر حتى يعاد الألبوم كاملا بجلسة أخرى
+            tasks = [asyncio.ensure_future(download_item(index)) for index in pending]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        items = [(item, entry) for item, entry in zip(group, media) if entry is not None]
+        async with turn:
+            if failed:
+                await bot.send_message(message.chat.id, f"Failed to download {len(failed)} album item(s): {failed}", reply_to_message_id=message.id)
+            if not items:
+                return
+            upload_start = time.perf_counter()
+            with stage_seconds.time(stage="upload"):
+                sent = await bot.send_media_group(message.chat.id, [entry for _, entry in items], reply_to_message_id=message.id)
+            record_transfer("up", sum(os.path.getsize(file) for file in files), time.perf_counter() - upload_start)
+            for (item, _), sent_msg in zip(items, sent):
+                remember_file_id(item, sent_msg)
+            transfers_total.inc(path="album")
+        logger.info(f"Finished album {msgid} ({len(items)} items, {len(pending)} downloaded) in {time.time() - start_time:.2f} seconds")
+    except FloodWait:
+        raise
     except Exception as e:
-        logger.error(f"Error handling media group: {e}")
-        await bot.send_message(message.chat.id, f"Sorry, an error occurred while processing media group: {str(e)}. Please try again.")
+        logger.error(f"Error sending media group {msgid}: {e}")
+        async with turn:
+            await bot.send_message(
+                message.chat.id,
+                f"Sorry, an error occurred while processing media group: {str(e)}. Please try again.",
+                reply_to_message_id=message.id
+            )
+    finally:
+        with stage_seconds.time(stage="cleanup"):
+            for file in files:
+                try:
+                    os.remove(file)
+                except OSError as e:
+                    logger.error(f"Failed to delete file {file}: {e}")
+            for reservation in reservations:
+                storage.release(reservation)
+            for source in sources:
+                journal.transfer_end(source)
+            if smsg is not None:
+                progress_bus.unwatch(status_key(smsg))
+                watchdog.unwatch(status_key(smsg))
+                await delete_status_message(smsg)
 
 # معالج أمر /start
 @bot.on_message(filters.command(["start"]))
@@ -195,278 +841,632 @@ async def speedtest_handler(client, message):
     logger.info(f"/speedtest command received from user {message.from_user.id} ({message.from_user.first_name})")
     await speedtest_command(client, message)
 
+# معالج أمر /cancel لإلغاء النطاقات الجارية
+@bot.on_message(filters.command(["cancel"]))
+async def cancel_handler(client, message):
+    logger.info(f"/cancel command received from user {message.from_user.id} ({message.from_user.first_name})")
+    if role == "coordinator":
+        cancelled = work_queue.cancel_user(message.from_user.id)
+    else:
+        cancelled = job_queue.cancel(message.from_user.id)
+    if cancelled:
+        await bot.send_message(message.chat.id, "Cancelling your running ranges...", reply_to_message_id=message.id)
+    else:
+        await bot.send_message(message.chat.id, "You have no running ranges.", reply_to_message_id=message.id)
+
 # معالج الرسائل النصية (روابط تليجرام)
 @bot.on_message(filters.text)
 async def save(client: pyrogram.client.Client, message: pyrogram.types.messages_and_media.message.Message):
     logger.info(f"Text message received from {message.from_user.id}: {message.text}")
 
-    # التحقق من صحة الرابط
-    if not is_valid_telegram_link(message.text):
-        await bot.send_message(message.chat.id, "Invalid Telegram link format. Please provide a valid Telegram link.")
+    # تحليل الرسالة إلى مهام (رابط واحد أو عدة روابط، كل سطر أو كلمة رابط)
+    jobs, invalid = parse_links(message.text, max_range)
+    if not jobs:
+        await bot.send_message(message.chat.id, f"Invalid Telegram link format. Please provide a valid Telegram link (ranges are limited to {max_range} messages).")
         return
+    if invalid:
+        await bot.send_message(message.chat.id, f"Skipped {len(invalid)} invalid link(s) (ranges are limited to {max_range} messages).", reply_to_message_id=message.id)
 
-    # معالجة روابط الانضمام
-    if "https://t.me/+" in message.text or "https://t.me/joinchat/" in message.text:
-        if acc is None:
-            await bot.send_message(
-                message.chat.id,
-                "Sorry, the string session is not set. Please configure it to access private content.",
-                reply_to_message_id=message.id
-            )
-            logger.warning("Attempt to join chat without string session set.")
+    # في وضع coordinator ينفذ المهام أحد العمال
+    if role == "coordinator":
+        await enqueue_links(message, jobs)
+        return
+
+    # تنفيذ المهام بالترتيب، كل مهمة بمعالج نوعها
+    for job in jobs:
+        await link_handlers[job.kind](message, job)
+
+# دالة للانضمام إلى دردشة عبر رابط دعوة بكل الجلسات؛ notify=False ينضم دون الرد على المستخدم
+async def handle_join_link(message, link, notify=True):
+    async def reply(text):
+        if notify:
+            await bot.send_message(message.chat.id, text, reply_to_message_id=message.id)
+
+    if acc is None:
+        await reply("Sorry, the string session is not set. Please configure it to access private content.")
+        logger.warning("Attempt to join chat without string session set.")
+        return
+    try:
+        if await join_chat_with_retry(acc, link.url):
+            await reply("**Chat Joined**")
+            await join_other_sessions(link.url)
+        else:
+            await reply("Please wait and try again due to Telegram rate limits.")
+    except UserAlreadyParticipant:
+        await reply("**Chat already Joined**")
+        logger.info("User already participant in chat.")
+        await join_other_sessions(link.url)
+    except InviteHashExpired:
+        await reply("**Invalid Link**")
+        logger.warning("Invite link expired or invalid.")
+    except Exception as e:
+        await reply(f"Sorry, an error occurred while joining chat: {str(e)}. Please try again.")
+        logger.error(f"Error joining chat: {e}")
+
+# دالة لوضع مهام الرسالة في طابور العمل المشترك؛ كل مهمة صف مستقل بنص روابطها
+# روابط الانضمام توضع لكل عامل لأن لكل عامل جلساته، ويرد على المستخدم العامل الأول فقط
+async def enqueue_links(message, jobs):
+    user_id = message.from_user.id
+    links = [job for job in jobs if job.kind != JOIN]
+    if links and work_queue.active(user_id) >= max_jobs_per_user:
+        await bot.send_message(
+            message.chat.id,
+            "You already have too many ranges in progress. Please wait for them to finish or send /cancel.",
+            reply_to_message_id=message.id
+        )
+        logger.warning(f"Work queue limit reached for user {user_id}")
+        links = []
+    for job in jobs:
+        if job.kind == JOIN:
+            for index in range(workers):
+                work_queue.enqueue("join", user_id, message.chat.id, message.id, job.text, target=f"worker{index}")
+    for job in links:
+        work_id = work_queue.enqueue("link", user_id, message.chat.id, message.id, job.text)
+        logger.info(f"Queued work {work_id} for user {user_id}: {job}")
+
+# معالجة مهمة رسائل (رسالة أو نطاق أو عدة روابط من نفس الدردشة)
+# msgids و job_id تمرر عند استكمال مهمة من السجل بعد إعادة التشغيل
+# on_item(msgid): يستدعى بعد انتهاء كل رسالة (يستخدمه العامل لحفظ التقدم في طابور العمل)
+async def process_message_links(message, link, msgids=None, job_id=None, on_item=None):
+    if msgids is None:
+        msgids = link.msgids
+
+    # القنوات الخاصة والبوتات تحتاج جلسة المستخدم
+    if acc is None and link.kind in (PRIVATE, BOT):
+        await bot.send_message(
+            message.chat.id,
+            "Sorry, the string session is not set. Please configure it to access private content.",
+            reply_to_message_id=message.id
+        )
+        logger.warning("Attempt to access private content without string session.")
+        if job_id is not None:
+            journal.finish_job(job_id, "failed")
+        return
+
+    # إيقاف باقي عناصر النطاق عند خطأ لا يمكن تجاوزه
+    aborted = asyncio.Event()
+
+    # جلب رسائل النطاق على دفعات مع قراءة النافذة التالية مسبقا
+    if link.kind == PUBLIC:
+        load = lambda ids: get_cached_messages(bot, link.chat, ids)
+    else:
+        load = lambda ids: prefetch_private(link.chat, ids)
+    prefetcher = RangePrefetcher(load, msgids)
+
+    # مجموعات الوسائط التي أرسلت بالفعل ضمن هذا النطاق
+    handled_groups = set()
+
+    # النطاقات تعامل كنقل جماعي بأولوية أقل من الردود التفاعلية
+    level = BULK if len(msgids) > 1 else INTERACTIVE
+
+    # تسجيل المهمة في السجل الدائم حتى تستكمل الرسائل المتبقية بعد إعادة التشغيل
+    if job_id is None:
+        job_id = journal.start_job(message.chat.id, message.id, message.from_user.id, link.text, msgids)
+
+    # تسجيل حالة كل رسالة بعد انتهائها؛ الإلغاء يبقيها معلقة إن كان بسبب إيقاف البوت
+    async def process_logged(msgid, turn):
+        try:
+            await process(msgid, turn)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            journal.item_done(job_id, msgid, "failed")
+            if on_item:
+                on_item(msgid)
+            raise
+        journal.item_done(job_id, msgid)
+        if on_item:
+            on_item(msgid)
+
+    # الرسالة الخاصة التي تنتمي لألبوم تنقل مع ألبومها كاملا مرة واحدة؛ تعيد True إذا عولجت هنا
+    # روابط ?single تنقل الرسالة المحددة فقط
+    async def handle_private_album(chatid, msgid, turn):
+        if link.single:
+            return False
+        owner = message_owners.get(f"{chatid}:{msgid}")
+        msg = cache.get(f"{owner.client.name}:{chatid}:{msgid}") if owner else None
+        if msg is None or not msg.media_group_id:
+            return False
+        if msg.media_group_id not in handled_groups:
+            handled_groups.add(msg.media_group_id)
+            await handle_media_group(message, chatid, msgid, turn, copy=False)
+        return True
+
+    # معالجة رسالة من قناة/مجموعة خاصة
+    async def process_private(msgid, turn):
+        if await handle_private_album(link.chat, msgid, turn):
             return
+        await handle_private(message, link.chat, msgid, turn)
+
+    # معالجة رسالة من محادثة بوت
+    async def process_bot(msgid, turn):
         try:
-            if await join_chat_with_retry(acc, message.text):
-                await bot.send_message(message.chat.id, "**Chat Joined**", reply_to_message_id=message.id)
-            else:
-                await bot.send_message(message.chat.id, "Please wait and try again due to Telegram rate limits.", reply_to_message_id=message.id)
-        except UserAlreadyParticipant:
-            await bot.send_message(message.chat.id, "**Chat already Joined**", reply_to_message_id=message.id)
-            logger.info("User already participant in chat.")
-        except InviteHashExpired:
-            await bot.send_message(message.chat.id, "**Invalid Link**", reply_to_message_id=message.id)
-            logger.warning("Invite link expired or invalid.")
+            if await handle_private_album(link.chat, msgid, turn):
+                return
+            await handle_private(message, link.chat, msgid, turn)
         except Exception as e:
-            await bot.send_message(
-                message.chat.id,
-                f"Sorry, an error occurred while joining chat: {str(e)}. Please try again.",
-                reply_to_message_id=message.id
-            )
-            logger.error(f"Error joining chat: {e}")
-        return
+            async with turn:
+                await bot.send_message(
+                    message.chat.id,
+                    f"Sorry, an error occurred while processing bot message: {str(e)}. Please try again.",
+                    reply_to_message_id=message.id
+                )
+            logger.error(f"Error handling bot private message: {e}")
 
-    # معالجة روابط الرسائل
-    if "https://t.me/" in message.text:
-        datas = message.text.split("/")
-        temp = datas[-1].replace("?single", "").split("-")
-        fromID = int(temp[0].strip())
+    # معالجة رسالة من قناة/مجموعة عامة
+    async def process_public(msgid, turn):
+        username = link.chat
         try:
-            toID = int(temp[1].strip())
-        except IndexError:
-            toID = fromID
-
-        for msgid in range(fromID, toID + 1):
-            # القنوات/المجموعات الخاصة
-            if "https://t.me/c/" in message.text:
-                chatid = int("-100" + datas[4])
-                if acc is None:
-                    await bot.send_message(
-                        message.chat.id,
-                        "Sorry, the string session is not set. Please configure it to access private content.",
-                        reply_to_message_id=message.id
-                    )
-                    logger.warning("Attempt to access private chat without string session.")
-                    return
-                await handle_private(message, chatid, msgid)
-
-            # البوتات
-            elif "https://t.me/b/" in message.text:
-                username = datas[4]
-                if acc is None:
-                    await bot.send_message(
-                        message.chat.id,
-                        "Sorry, the string session is not set. Please configure it to access private content.",
-                        reply_to_message_id=message.id
-                    )
-                    logger.warning("Attempt to access bot content without string session.")
-                    return
-                try:
-                    await handle_private(message, username, msgid)
-                except Exception as e:
-                    await bot.send_message(
-                        message.chat.id,
-                        f"Sorry, an error occurred while processing bot message: {str(e)}. Please try again.",
-                        reply_to_message_id=message.id
-                    )
-                    logger.error(f"Error handling bot private message: {e}")
-
-            # القنوات/المجموعات العامة
-            else:
-                username = datas[3]
-                try:
-                    msg = await get_cached_message(bot, username, msgid)
-                except UsernameNotOccupied:
-                    await bot.send_message(
-                        message.chat.id,
-                        "The provided username does not exist. Please check the link and try again.",
-                        reply_to_message_id=message.id
-                    )
-                    logger.warning(f"Username not occupied: {username}")
-                    return
-                try:
-                    if msg.media_group_id:
-                        await handle_media_group(bot, message, msg.chat.id, msg.id)
-                    else:
-                        await bot.copy_message(message.chat.id, msg.chat.id, msg.id, reply_to_message_id=message.id)
-                    logger.info(f"Copied message {msgid} from {username} to chat {message.chat.id}")
-                except Exception as e:
-                    if acc is None:
-                        await bot.send_message(
-                            message.chat.id,
-                            "Sorry, the string session is not set. Please configure it to access private content.",
-                            reply_to_message_id=message.id
-                        )
-                        logger.warning("Attempt to copy restricted media without string session.")
-                        return
-                    try:
-                        await handle_private(message, username, msgid)
-                    except Exception as e:
-                        await bot.send_message(
-                            message.chat.id,
-                            f"Sorry, an error occurred while processing message: {str(e)}. Please try again.",
-                            reply_to_message_id=message.id
-                        )
-                        logger.error(f"Error handling private message fallback: {e}")
+            msg = await get_cached_message(bot, username, msgid)
+        except UsernameNotOccupied:
+            aborted.set()
+            async with turn:
+                await bot.send_message(
+                    message.chat.id,
+                    "The provided username does not exist. Please check the link and try again.",
+                    reply_to_message_id=message.id
+                )
+            logger.warning(f"Username not occupied: {username}")
+            return
+
+        # كل مجموعة وسائط ترسل مرة واحدة فقط حتى لو شمل النطاق كل عناصرها (إلا مع ?single)
+        if msg.media_group_id and not link.single:
+            if msg.media_group_id not in handled_groups:
+                handled_groups.add(msg.media_group_id)
+                await handle_media_group(message, username, msgid, turn)
+            return
+
+        # المحتوى المحمي لا يمكن نسخه، فننتقل مباشرة إلى التحميل بالتوازي
+        if msg.has_protected_content and acc is not None:
+            await handle_private(message, username, msgid, turn)
+            return
+
+        await turn.wait()
+        try:
+            await bot.copy_message(message.chat.id, msg.chat.id, msg.id, reply_to_message_id=message.id)
+            transfers_total.inc(path="copy")
+            logger.info(f"Copied message {msgid} from {username} to chat {message.chat.id}")
+        except Exception as e:
+            if acc is None:
+                aborted.set()
+                await bot.send_message(
+                    message.chat.id,
+                    "Sorry, the string session is not set. Please configure it to access private content.",
+                    reply_to_message_id=message.id
+                )
+                logger.warning("Attempt to copy restricted media without string session.")
+                return
+            try:
+                await handle_private(message, username, msgid, turn)
+            except Exception as e:
+                await bot.send_message(
+                    message.chat.id,
+                    f"Sorry, an error occurred while processing message: {str(e)}. Please try again.",
+                    reply_to_message_id=message.id
+                )
+                logger.error(f"Error handling private message fallback: {e}")
+
+    # معالج الرسائل يحدد مرة واحدة حسب نوع الرابط بدلا من فحص الرابط لكل رسالة
+    process_item = {PRIVATE: process_private, BOT: process_bot, PUBLIC: process_public}[link.kind]
+
+    # معالجة رسالة واحدة من النطاق؛ الإرسال للمستخدم يتم بالترتيب عبر turn
+    async def process(msgid, turn):
+        if aborted.is_set():
+            return
+        # كل عنصر يعمل داخل مهمة عامل خاصة بالنطاق، فتغيير الأولوية هنا لا يتسرب لغيره
+        current_priority.set(level)
+        await prefetcher.ensure(msgid)
+        await process_item(msgid, turn)
+
+    try:
+        job = await job_queue.run(message.from_user.id, msgids, process_logged)
+    except QueueFull:
+        prefetcher.close()
+        journal.finish_job(job_id, "rejected")
+        await bot.send_message(
+            message.chat.id,
+            "You already have too many ranges in progress. Please wait for them to finish or send /cancel.",
+            reply_to_message_id=message.id
+        )
+        logger.warning(f"Job queue full for user {message.from_user.id}")
+        return
+    prefetcher.close()
+    journal.finish_job(job_id, "cancelled" if job.cancelled else "done")
+    if job.cancelled:
+        await bot.send_message(message.chat.id, "**Cancelled**", reply_to_message_id=message.id)
 
-            await rate_limited_sleep()
+# جدول توجيه المهام إلى معالجاتها حسب نوع الرابط
+link_handlers = {
+    JOIN: handle_join_link,
+    PUBLIC: process_message_links,
+    PRIVATE: process_message_links,
+    BOT: process_message_links,
+}
 
 # دالة لمعالجة الرسائل الخاصة
-async def handle_private(message: pyrogram.types.messages_and_media.message.Message, chatid: int, msgid: int):
+# turn (اختياري) يضمن أن الإرسال للمستخدم يتم بترتيب رسائل النطاق بينما يجري التحميل بالتوازي
+async def handle_private(message: pyrogram.types.messages_and_media.message.Message, chatid: int, msgid: int, turn=None):
     start_time = time.time()
     logger.info(f"Handling private message {msgid} from chat {chatid} for user {message.from_user.id}")
+    turn = turn or NoTurn()
+    await run_with_session(
+        message, chatid, msgid, turn,
+        lambda client: transfer_private(client, message, chatid, msgid, turn, start_time)
+    )
 
-    # التحقق من إذن الوصول
-    if not await check_chat_access(acc, chatid):
-        await bot.send_message(message.chat.id, f"Cannot access chat {chatid}. Please ensure the account is a member and has permission to view messages.", reply_to_message_id=message.id)
+# تشغيل work(client) بجلسة تملك وصولا للدردشة، والانتقال لجلسة أخرى عند FloodWait
+# النقل الذي يوقفه المراقب لتوقف تقدمه يعاد من جديد (حتى MAX_TRANSFER_RESTARTS مرة)
+# work يعيد خطأ طلبات الجلسة نفسها (جلب الرسالة أو تحميلها) بعد الرد على المستخدم، وهو وحده يحسب على صحة الجلسة
+async def run_with_session(message, chatid, msgid, turn, work):
+    flooded = set()
+    restarts = 0
+    while True:
+        try:
+            with stage_seconds.time(stage="access_check"):
+                session = await account_pool.acquire(chatid, exclude=flooded, prefer=message_owners.get(f"{chatid}:{msgid}"))
+        except NoSessionAvailable:
+            async with turn:
+                if flooded:
+                    await bot.send_message(message.chat.id, "Please wait and try again due to Telegram rate limits.", reply_to_message_id=message.id)
+                else:
+                    await bot.send_message(message.chat.id, f"Cannot access chat {chatid}. Please ensure the account is a member and has permission to view messages.", reply_to_message_id=message.id)
+            return
+        # انتظار العمل دون تمرير الإلغاء إليه، فيتميز إلغاء الطلب نفسه (/cancel أو الإيقاف) عن إعادة تشغيل المراقب
+        task = asyncio.ensure_future(work(session.client))
+        try:
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            task.cancel()
+            try:
+                await asyncio.wait([task])
+            finally:
+                account_pool.release(session, neutral=True)
+            raise
+        try:
+            error = task.result()
+        except FloodWait as e:
+            account_pool.release(session, e)
+            flooded.add(session)
+            logger.warning(f"Session {session.name} flooded while handling message {msgid}, failing over")
+            continue
+        except asyncio.CancelledError:
+            if not watchdog.restarted(task):
+                account_pool.release(session, neutral=True)
+                raise
+            account_pool.release(session, TimeoutError(f"transfer of message {msgid} stalled"))
+            restarts += 1
+            if restarts > max_transfer_restarts:
+                logger.error(f"Giving up on message {msgid} after {restarts} stalled attempts")
+                async with turn:
+                    await bot.send_message(message.chat.id, "The transfer stopped making progress. Please try again later.", reply_to_message_id=message.id)
+                return
+            continue
+        except BaseException:
+            # أخطاء البوت والأخطاء البرمجية لا تعني أن الجلسة معطلة
+            account_pool.release(session, neutral=True)
+            raise
+        account_pool.release(session, error)
         return
 
+# دالة لنقل رسالة خاصة واحدة باستخدام جلسة مستخدم محددة
+async def transfer_private(client, message, chatid, msgid, turn, start_time):
     # جلب الرسالة من التخزين المؤقت
     try:
-        msg: pyrogram.types.messages_and_media.message.Message = await get_cached_message(acc, chatid, msgid)
+        with stage_seconds.time(stage="fetch"):
+            msg: pyrogram.types.messages_and_media.message.Message = await get_cached_message(client, chatid, msgid)
         logger.info(f"Successfully retrieved message {msgid} from chat {chatid}")
+    except FloodWait:
+        raise
     except Exception as e:
         logger.error(f"Failed to retrieve message {msgid} from chat {chatid}: {str(e)}")
-        await bot.send_message(message.chat.id, f"Failed to retrieve message: {str(e)}", reply_to_message_id=message.id)
+        chat_cache.invalidate(client, chatid)
+        async with turn:
+            await bot.send_message(message.chat.id, f"Failed to retrieve message: {str(e)}", reply_to_message_id=message.id)
+        return e
+
+    # الرسالة المحذوفة تعود فارغة (empty) وبدون دردشة
+    if msg.empty:
+        logger.warning(f"Message {msgid} from chat {chatid} is deleted or unavailable")
+        async with turn:
+            await bot.send_message(message.chat.id, f"Message {msgid} was deleted or is not available.", reply_to_message_id=message.id)
         return
 
     msg_type = get_message_type(msg)
 
+    # النسخ من جهة الخادم إن كانت الدردشة تسمح بذلك
+    if msg_type not in ("Text", "Unknown") and await try_server_copy(client, message, msg, turn):
+        logger.info(f"Finished processing message {msgid} by copy in {time.time() - start_time:.2f} seconds")
+        return
+
     # معالجة الرسائل النصية
     if msg_type == "Text":
-        await bot.send_message(message.chat.id, msg.text, entities=msg.entities, reply_to_message_id=message.id)
+        async with turn:
+            await bot.send_message(message.chat.id, msg.text, entities=msg.entities, reply_to_message_id=message.id)
+        transfers_total.inc(path="text")
         logger.info(f"Finished processing message {msgid} in {time.time() - start_time:.2f} seconds")
         return
 
+    # إعادة الإرسال من ذاكرة file_id إن أمكن دون تحميل أو رفع
+    cached = file_cache.get(msg.chat.id, msg.id)
+    if cached is not None:
+        await turn.wait()
+        if await send_cached_file(message, msg, *cached):
+            transfers_total.inc(path="file_id")
+            logger.info(f"Finished processing message {msgid} from file_id cache in {time.time() - start_time:.2f} seconds")
+            return
+
     # إرسال رسالة مؤقتة للتحميل
     smsg = await bot.send_message(message.chat.id, "Downloading", reply_to_message_id=message.id)
 
-    # بدء تحديث حالة التحميل
-    executor.submit(lambda: asyncio.run(downstatus(f"{message.id}downstatus.txt", smsg)))
-
-    # تحميل الوسائط
-    try:
-        file = await download_media_stream(acc, msg, progress, [message, "down"])
-    except Exception as e:
-        logger.error(f"Failed to download media for message {msgid}: {str(e)}")
-        await bot.send_message(message.chat.id, f"Failed to download media: {str(e)}", reply_to_message_id=message.id)
-        return
+    # بدء تحديث حالة التحميل وتسجيل النقل في السجل الدائم
+    progress_bus.watch(smsg.chat.id, smsg.id)
+    source = f"{message.chat.id}:{chatid}:{msgid}"
+    journal.transfer_begin(source, smsg.chat.id, smsg.id)
 
-    # حذف ملف حالة التحميل
+    # جلب الصورة المصغرة بالتوازي مع التحميل الرئيسي بدلا من انتظاره
+    thumb_task = asyncio.ensure_future(fetch_thumbnail(client, msg, msg_type))
+    watchdog.watch(status_key(smsg))
     try:
-        os.remove(f"{message.id}downstatus.txt")
-    except OSError as e:
-        logger.error(f"Failed to delete file {f'{message.id}downstatus.txt'}: {e}")
+        return await transfer_media(client, message, msg, msg_type, msgid, smsg, source, turn, thumb_task, start_time)
+    except asyncio.CancelledError:
+        # رسالة الحالة تحذف عند أي إلغاء؛ النقل المعاد يبدأ برسالة حالة جديدة ويستكمل ملفه الجزئي من السجل
+        # والتحميل المشترك المتوقف يلغى حتى لا ينضم إليه الطلب المعاد، وينتقل باقي مستخدميه لتحميل جديد
+        # إلغاء المستخدم (/cancel) يحذف النقل من السجل، ويبقى فيه عند إيقاف البوت فقط
+        progress_bus.unwatch(status_key(smsg))
+        if watchdog.restarted(asyncio.current_task()):
+            shared_downloads.abort(f"{msg.chat.id}:{msg.id}")
+        elif not stopping.is_set():
+            journal.transfer_end(source)
+        asyncio.ensure_future(delete_status_message(smsg))
+        raise
+    finally:
+        watchdog.unwatch(status_key(smsg))
+        thumb_task.cancel()
 
-    # بدء تحديث حالة الرفع
-    executor.submit(lambda: asyncio.run(upstatus(f"{message.id}upstatus.txt", smsg)))
+# مفتاح عملية النقل في ناقل التقدم والمراقب: معرفات الرسائل فريدة داخل الدردشة فقط
+def status_key(smsg):
+    return smsg.chat.id, smsg.id
 
+async def delete_status_message(smsg):
     try:
-        # معالجة أنواع الوسائط المختلفة
-        if msg_type == "Document":
-            thumb = None
-            try:
-                thumb = await download_media_stream(acc, msg.document.thumbs[0], None, None)
-            except Exception:
-                pass
-            await bot.send_document(
-                message.chat.id, file, thumb=thumb, caption=msg.caption, caption_entities=msg.caption_entities,
-                reply_to_message_id=message.id, progress=progress, progress_args=[message, "up"]
-            )
-            if thumb:
-                try:
-                    os.remove(thumb)
-                except OSError as e:
-                    logger.error(f"Failed to delete thumbnail {thumb}: {e}")
-
-        elif msg_type == "Video":
-            thumb = None
-            try:
-                thumb = await download_media_stream(acc, msg.video.thumbs[0], None, None)
-            except Exception:
-                pass
-            await bot.send_video(
-                message.chat.id, file, duration=msg.video.duration, width=msg.video.width, height=msg.video.height,
-                thumb=thumb, caption=msg.caption, caption_entities=msg.caption_entities, reply_to_message_id=message.id,
-                progress=progress, progress_args=[message, "up"]
-            )
-            if thumb:
-                try:
-                    os.remove(thumb)
-                except OSError as e:
-                    logger.error(f"Failed to delete thumbnail {thumb}: {e}")
+        await bot.delete_messages(smsg.chat.id, [smsg.id])
+    except Exception as e:
+        logger.error(f"Error deleting temporary message: {e}")
 
-        elif msg_type == "Animation":
-            await bot.send_animation(message.chat.id, file, reply_to_message_id=message.id)
+# دالة لانتظار النقل المباشر الجاري لنفس الرسالة ثم إعادة إرساله بـ file_id الناتج عنه؛ تعيد True عند النجاح
+# عند فشل النقل الجاري يعاد False ليبدأ الطلب نقله بنفسه
+async def follow_inflight_relay(message, msg, turn):
+    key = f"{msg.chat.id}:{msg.id}"
+    joined = False
+    while (flight := relay_flights.get(key)) is not None:
+        if not joined:
+            joined = True
+            cache_requests.inc(cache="inflight", result="hit")
+            logger.info(f"Waiting for in-flight relay of message {msg.id} from chat {msg.chat.id}")
+        await asyncio.shield(flight)
+        cached = file_cache.get(msg.chat.id, msg.id)
+        if cached is not None:
+            await turn.wait()
+            return await send_cached_file(message, msg, *cached)
+    if not joined:
+        cache_requests.inc(cache="inflight", result="miss")
+    return False
 
-        elif msg_type == "Sticker":
-            await bot.send_sticker(message.chat.id, file, reply_to_message_id=message.id)
+# دالة لنقل ملف الوسائط بعد إنشاء رسالة الحالة: مباشرة إن أمكن وإلا عبر القرص
+async def transfer_media(client, message, msg, msg_type, msgid, smsg, source, turn, thumb_task, start_time):
+    # النقل المباشر دون المرور بالقرص، مع الرجوع إلى مسار القرص عند الفشل
+    if can_relay(msg, msg_type):
+        # طلب متزامن لنفس الرسالة: انتظار النقل الجاري ثم إعادة الإرسال بـ file_id الناتج عنه
+        if await follow_inflight_relay(message, msg, turn):
+            transfers_total.inc(path="file_id")
+            progress_bus.unwatch(status_key(smsg))
+            journal.transfer_end(source)
+            await delete_status_message(smsg)
+            logger.info(f"Finished processing message {msgid} from a shared relay in {time.time() - start_time:.2f} seconds")
+            return
+        key = f"{msg.chat.id}:{msg.id}"
+        flight = relay_flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            relay_start = time.perf_counter()
+            with stage_seconds.time(stage="relay"):
+                media = await relay_upload(client, msg, msg_type, smsg, thumb_task)
+            size = getattr(msg, msg_type.lower()).file_size
+            record_transfer("down", size, time.perf_counter() - relay_start)
+            record_transfer("up", size, time.perf_counter() - relay_start)
+            await turn.wait()
+            sent = await send_uploaded_media(message, msg, media)
+            remember_file_id(msg, sent)
+            transfers_total.inc(path="relay")
+            progress_bus.unwatch(status_key(smsg))
+            journal.transfer_end(source)
+            await delete_status_message(smsg)
+            logger.info(f"Finished relaying message {msgid} in {time.time() - start_time:.2f} seconds")
+            return
+        except Exception as e:
+            logger.warning(f"Relay failed for message {msgid}, falling back to disk download: {e}")
+        finally:
+            if relay_flights.get(key) is flight:
+                del relay_flights[key]
+            flight.set_result(None)
 
-        elif msg_type == "Voice":
-            await bot.send_voice(
-                message.chat.id, file, caption=msg.caption, caption_entities=msg.caption_entities,
-                reply_to_message_id=message.id, progress=progress, progress_args=[message, "up"]
-            )
+    # التحميل مشترك بين الطلبات المتزامنة لنفس الرسالة: يحمل الملف مرة واحدة ويرفعه كل طلب بنفسه
+    # الطلب المنضم بجلسة أخرى لا يرث أخطاء جلسة التحميل، بل يعيد التحميل بجلسته إذا فشل
+    key = f"{msg.chat.id}:{msg.id}"
+    size = getattr(getattr(msg, msg_type.lower(), None), "file_size", None)
 
-        elif msg_type == "Audio":
-            thumb = None
-            try:
-                thumb = await download_media_stream(acc, msg.audio.thumbs[0], None, None)
-            except Exception:
-                pass
-            await bot.send_audio(
-                message.chat.id, file, caption=msg.caption, caption_entities=msg.caption_entities,
-                reply_to_message_id=message.id, progress=progress, progress_args=[message, "up"]
-            )
-            if thumb:
-                try:
-                    os.remove(thumb)
-                except OSError as e:
-                    logger.error(f"Failed to delete thumbnail {thumb}: {e}")
+    # حجز مساحة القرص قبل التحميل؛ عند امتلاء الحصة ينتظر النقل دوره بدلا من البدء
+    async def on_storage_wait():
+        try:
+            await bot.edit_message_text(smsg.chat.id, smsg.id, "Queued: waiting for free disk space")
+        except Exception as e:
+            logger.warning(f"Failed to update status message: {e}")
 
-        elif msg_type == "Photo":
-            await bot.send_photo(
-                message.chat.id, file, caption=msg.caption, caption_entities=msg.caption_entities,
-                reply_to_message_id=message.id
+    # التحميل المشترك؛ الحجز له أولوية المقدمة إذا كان أي طلب مرتبط به في مقدمة مهمته
+    async def download(progress):
+        with stage_seconds.time(stage="storage_wait"):
+            reservation = await storage.reserve(
+                size, source, on_wait=on_storage_wait,
+                is_head=lambda: any(t.is_head() for t in download_turns.get(key, ()))
             )
+        try:
+            download_start = time.perf_counter()
+            with stage_seconds.time(stage="download"):
+                file = await download_message_media(client, msg, msg_type, smsg, source, reservation, progress)
+        except BaseException:
+            storage.release(reservation)
+            raise
+        reservation.path = file
+        record_transfer("down", os.path.getsize(file), time.perf_counter() - download_start)
+        return file, reservation
 
-    except Exception as e:
-        logger.error(f"Error sending media for message {msgid}: {str(e)}")
-        await bot.send_message(
-            message.chat.id,
-            f"Sorry, an error occurred while sending media: {str(e)}. Please try again.",
-            reply_to_message_id=message.id
-        )
-    finally:
-        # حذف ملف الوسائط
+    # حذف الملف وتحرير حجزه بعد انتهاء آخر طلب يستخدمه
+    def cleanup(result):
+        file, reservation = result
         try:
             os.remove(file)
         except OSError as e:
             logger.error(f"Failed to delete file {file}: {e}")
+        storage.release(reservation)
 
-        # حذف ملف حالة الرفع
-        try:
-            if os.path.exists(f"{message.id}upstatus.txt"):
-                os.remove(f"{message.id}upstatus.txt")
-        except OSError as e:
-            logger.error(f"Failed to delete file {f'{message.id}upstatus.txt'}: {e}")
+    async def on_progress(current, total):
+        await progress_bus.callback(current, total, status_key(smsg), "down")
 
-        # حذف رسالة التحميل المؤقتة
-        try:
-            await bot.delete_messages(message.chat.id, [smsg.id])
-        except Exception as e:
-            logger.error(f"Error deleting temporary message: {e}")
+    download_turns.setdefault(key, []).append(turn)
+    try:
+        lease = await shared_downloads.acquire(key, download, progress=on_progress, cleanup=cleanup, owner=client.name)
+    except InsufficientStorage as e:
+        progress_bus.unwatch(status_key(smsg))
+        journal.transfer_end(source)
+        await delete_status_message(smsg)
+        logger.error(f"No disk space for message {msgid}: {e}")
+        async with turn:
+            await bot.send_message(message.chat.id, f"Not enough disk space to download this file: {e}", reply_to_message_id=message.id)
+        return
+    except Exception as e:
+        progress_bus.unwatch(status_key(smsg))
+        journal.transfer_end(source)
+        if isinstance(e, FloodWait):
+            await delete_status_message(smsg)
+            raise
+        logger.error(f"Failed to download media for message {msgid}: {str(e)}")
+        async with turn:
+            await bot.send_message(message.chat.id, f"Failed to download media: {str(e)}", reply_to_message_id=message.id)
+        return e
+    finally:
+        turns = download_turns[key]
+        turns.remove(turn)
+        if not turns:
+            del download_turns[key]
+    cache_requests.inc(cache="inflight", result="miss" if lease.leader else "hit")
 
-        logger.info(f"Finished processing message {msgid} in {time.time() - start_time:.2f} seconds")
+    try:
+        file, _ = lease.result
+        size = os.path.getsize(file)
+
+        # طلب منضم لتحميل مشترك: إن سبقه طلب آخر إلى الرفع يعاد الإرسال بـ file_id دون رفع جديد
+        await turn.wait()
+        cached = None if lease.leader else file_cache.get(msg.chat.id, msg.id)
+        if cached is not None and await send_cached_file(message, msg, *cached):
+            transfers_total.inc(path="file_id")
+            lease.release()
+            progress_bus.unwatch(status_key(smsg))
+            journal.transfer_end(source)
+            await delete_status_message(smsg)
+            logger.info(f"Finished processing message {msgid} from a shared download in {time.time() - start_time:.2f} seconds")
+            return
+
+        # الرفع يتم عند حلول دور الرسالة للحفاظ على ترتيب النطاق
+        async with turn:
+            sent = None
+            try:
+                thumb = await thumb_task
+                upload_start = time.perf_counter()
+                with stage_seconds.time(stage="upload"):
+                    # معالجة أنواع الوسائط المختلفة
+                    if msg_type == "Document":
+                        sent = await bot.send_document(
+                            message.chat.id, file, thumb=thumb, caption=msg.caption, caption_entities=msg.caption_entities,
+                            reply_to_message_id=message.id, progress=progress_bus.callback, progress_args=[status_key(smsg), "up"]
+                        )
+
+                    elif msg_type == "Video":
+                        sent = await bot.send_video(
+                            message.chat.id, file, duration=msg.video.duration, width=msg.video.width, height=msg.video.height,
+                            thumb=thumb, caption=msg.caption, caption_entities=msg.caption_entities, reply_to_message_id=message.id,
+                            progress=progress_bus.callback, progress_args=[status_key(smsg), "up"]
+                        )
+
+                    elif msg_type == "Animation":
+                        sent = await bot.send_animation(message.chat.id, file, reply_to_message_id=message.id)
+
+                    elif msg_type == "Sticker":
+                        sent = await bot.send_sticker(message.chat.id, file, reply_to_message_id=message.id)
+
+                    elif msg_type == "Voice":
+                        sent = await bot.send_voice(
+                            message.chat.id, file, caption=msg.caption, caption_entities=msg.caption_entities,
+                            reply_to_message_id=message.id, progress=progress_bus.callback, progress_args=[status_key(smsg), "up"]
+                        )
+
+                    elif msg_type == "Audio":
+                        sent = await bot.send_audio(
+                            message.chat.id, file, thumb=thumb, caption=msg.caption, caption_entities=msg.caption_entities,
+                            reply_to_message_id=message.id, progress=progress_bus.callback, progress_args=[status_key(smsg), "up"]
+                        )
+
+                    elif msg_type == "Photo":
+                        sent = await bot.send_photo(
+                            message.chat.id, file, caption=msg.caption, caption_entities=msg.caption_entities,
+                            reply_to_message_id=message.id
+                        )
+                record_transfer("up", size, time.perf_counter() - upload_start)
+                transfers_total.inc(path="disk")
+
+                # حفظ file_id للطلبات القادمة
+                remember_file_id(msg, sent)
+
+            except Exception as e:
+                logger.error(f"Error sending media for message {msgid}: {str(e)}")
+                await bot.send_message(
+                    message.chat.id,
+                    f"Sorry, an error occurred while sending media: {str(e)}. Please try again.",
+                    reply_to_message_id=message.id
+                )
+            finally:
+                with stage_seconds.time(stage="cleanup"):
+                    # تحرير الملف المشترك؛ يحذف بعد انتهاء آخر طلب يستخدمه
+                    lease.release()
+
+                    # إيقاف تحديث حالة الرفع وإنهاء النقل في السجل
+                    progress_bus.unwatch(status_key(smsg))
+                    journal.transfer_end(source)
+
+                    # حذف رسالة التحميل المؤقتة
+                    await delete_status_message(smsg)
+
+                logger.info(f"Finished processing message {msgid} in {time.time() - start_time:.2f} seconds")
+    finally:
+        lease.release()
 
 # دالة لتحديد نوع الرسالة
 def get_message_type(msg: pyrogram.types.messages_and_media.message.Message):
@@ -512,12 +1512,220 @@ def get_message_type(msg: pyrogram.types.messages_and_media.message.Message):
         pass
     return "Unknown"
 
+# حذف رسائل الحالة والملفات الجزئية التي تركها إيقاف سابق
+# الملف الجزئي يبقى يوما واحدا ليستكمل تحميله إذا أعيد طلب نفس الرسالة
+async def cleanup_interrupted_transfers(max_age=86400):
+    keep = set()
+    for transfer in journal.interrupted_transfers():
+        if transfer["status_message_id"] is not None:
+            try:
+                await bot.delete_messages(transfer["status_chat_id"], [transfer["status_message_id"]])
+            except Exception as e:
+                logger.warning(f"Failed to delete stale status message for {transfer['source']}: {e}")
+            journal.clear_status_message(transfer["source"])
+        if transfer["path"] and transfer["segments"] != "[]" and time.time() - transfer["updated"] < max_age:
+            keep.add(transfer["path"])
+            logger.info(f"Keeping partial download {transfer['path']} ({transfer['bytes_done']}/{transfer['size']} bytes)")
+        else:
+            journal.transfer_end(transfer["source"])
+
+    if not os.path.isdir(download_dir):
+        return
+    for name in os.listdir(download_dir):
+        path = os.path.join(download_dir, name)
+        if path not in keep and os.path.isfile(path):
+            try:
+                os.remove(path)
+                logger.info(f"Removed orphaned download {path}")
+            except OSError as e:
+                logger.error(f"Failed to remove orphaned download {path}: {e}")
+
+# استكمال المهام التي لم تنته قبل إعادة التشغيل
+async def resume_jobs():
+    for job, pending in journal.incomplete_jobs():
+        if not pending:
+            journal.finish_job(job["id"])
+            continue
+        try:
+            message = await bot.get_messages(job["chat_id"], job["message_id"])
+        except Exception as e:
+            message = None
+            logger.error(f"Failed to fetch original message of job {job['id']}: {e}")
+        links, _ = parse_links(job["link"])
+        if message is None or message.empty or not links:
+            journal.finish_job(job["id"], "failed")
+            continue
+        logger.info(f"Resuming job {job['id']} for user {job['user_id']}: {len(pending)} message(s) left")
+        try:
+            await bot.send_message(
+                message.chat.id,
+                f"Resuming your link after a restart ({len(pending)} message(s) left)",
+                reply_to_message_id=message.id
+            )
+        except Exception as e:
+            logger.warning(f"Failed to notify user about resumed job {job['id']}: {e}")
+        asyncio.create_task(process_message_links(message, links[0], pending, job["id"]))
+
+# تنفيذ مهمة واحدة من طابور العمل داخل العامل؛ cancelled: معرفات المهام التي ألغاها المستخدم
+async def execute_work(row, cancelled):
+    status = "done"
+    try:
+        message = pyrogram.types.Message(
+            id=row["message_id"], chat=pyrogram.types.Chat(id=row["chat_id"], type=pyrogram.enums.ChatType.PRIVATE),
+            from_user=pyrogram.types.User(id=row["user_id"]), text=row["text"]
+        )
+        link = parse_links(row["text"])[0][0]
+        if link.kind == JOIN:
+            await handle_join_link(message, link, notify=worker_index == 0)
+        else:
+            # المهمة المستلمة من عامل متوقف تكمل الرسائل المتبقية فقط
+            done = set(row["done"])
+            msgids = [msgid for msgid in link.msgids if msgid not in done] if done else None
+            await process_message_links(message, link, msgids, on_item=lambda msgid: work_queue.item_done(row["id"], msgid))
+        if row["id"] in cancelled:
+            status = "cancelled"
+    except Exception as e:
+        status = "failed"
+        logger.error(f"Work {row['id']} failed: {e}")
+    work_queue.finish(row["id"], worker_name, status)
+
+# حلقة العامل: استلام المهام من طابور العمل وتنفيذها مع تجديد عقودها
+# المهمة التي فقد العامل عقدها (توقف طويل) توقف لأن عملية أخرى استلمتها
+# أخطاء قاعدة البيانات (مثل database is locked) لا توقف الحلقتين بل يعاد المحاولة بعد مهلة
+async def run_worker():
+    running = {}
+    cancelled = set()
+    renewed = {}  # آخر استلام أو تجديد ناجح لعقد كل مهمة
+
+    async def renew():
+        while True:
+            await asyncio.sleep(work_queue.lease / 3)
+            try:
+                held = work_queue.renew(worker_name, list(running))
+            except Exception as e:
+                logger.error(f"Failed to renew work leases: {e}")
+                # بعد انتهاء مدة العقد قد تستلم عملية أخرى المهمة، فتوقف هنا حتى لا تسلم مرتين
+                for work_id, (task, _) in list(running.items()):
+                    if time.monotonic() - renewed.get(work_id, 0.0) >= work_queue.lease:
+                        logger.warning(f"Could not renew the lease on work {work_id}, stopping it")
+                        task.cancel()
+                continue
+            for work_id in held:
+                renewed[work_id] = time.monotonic()
+            for work_id, (task, row) in list(running.items()):
+                if work_id not in held:
+                    logger.warning(f"Lost the lease on work {work_id}, stopping it")
+                    task.cancel()
+                elif held[work_id] and work_id not in cancelled:
+                    cancelled.add(work_id)
+                    job_queue.cancel(row["user_id"])
+
+    renewer = asyncio.create_task(renew())
+    try:
+        while True:
+            try:
+                row = work_queue.claim(worker_name, per_user=max_jobs_per_user) if len(running) < worker_jobs else None
+            except Exception as e:
+                logger.error(f"Failed to claim work: {e}")
+                row = None
+            if row is None:
+                await asyncio.sleep(worker_poll_interval)
+                continue
+            logger.info(f"Claimed work {row['id']} for user {row['user_id']}: {row['text']}")
+            task = asyncio.create_task(execute_work(row, cancelled))
+            running[row["id"]] = (task, row)
+            renewed[row["id"]] = time.monotonic()
+
+            def forget(_, work_id=row["id"]):
+                running.pop(work_id, None)
+                renewed.pop(work_id, None)
+                cancelled.discard(work_id)
+
+            task.add_done_callback(forget)
+    finally:
+        renewer.cancel()
+        for task, _ in running.values():
+            task.cancel()
+        work_queue.release_worker(worker_name)
+
+# تشغيل عملية عامل ومراقبتها، وإعادة تشغيلها عند خروجها مع تأخير متزايد إذا تكرر سقوطها بسرعة
+async def supervise_worker(index):
+    delay = 1
+    while True:
+        env = dict(os.environ, ROLE="worker", WORKER_INDEX=str(index), WORKERS=str(workers))
+        process = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), env=env)
+        logger.info(f"Started worker {index} (pid {process.pid})")
+        started = time.monotonic()
+        try:
+            code = await process.wait()
+        except asyncio.CancelledError:
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), 30)
+            except asyncio.TimeoutError:
+                process.kill()
+            raise
+        delay = 1 if time.monotonic() - started > 60 else min(delay * 2, 60)
+        logger.warning(f"Worker {index} exited with code {code}, restarting in {delay}s")
+        await asyncio.sleep(delay)
+
+# حذف المهام المنتهية القديمة من طابور العمل
+async def purge_work_queue(interval=3600):
+    while True:
+        removed = work_queue.purge()
+        if removed:
+            logger.info(f"Purged {removed} finished work item(s)")
+        await asyncio.sleep(interval)
+
+# ضبط حد التوازي حسب عرض النطاق المقاس
+def resize_for_bandwidth(result):
+    suggested = speed_meter.suggested_concurrency(transfer_mbps, maximum=concurrency)
+    if suggested is not None:
+        job_queue.resize(suggested)
+
+async def main():
+    await bot.start()
+    tasks = []
+    if role != "coordinator":
+        await cleanup_interrupted_transfers()
+        storage.start_sweeper(storage_sweep_interval)
+        if speedtest_interval > 0:
+            speed_meter.start_sampler(speedtest_interval, on_sample=resize_for_bandwidth)
+    if role == "single":
+        await resume_jobs()
+    elif role == "worker":
+        # مهام العامل قبل إعادة تشغيله تعود للطابور وتستكمل من تقدمها المحفوظ فيه وليس من سجله
+        for job, _ in journal.incomplete_jobs():
+            journal.finish_job(job["id"], "requeued")
+        work_queue.release_worker(worker_name, crashed=True)
+        tasks.append(asyncio.create_task(run_worker()))
+    else:
+        tasks.append(asyncio.create_task(purge_work_queue()))
+        if spawn_workers:
+            tasks.extend(asyncio.create_task(supervise_worker(index)) for index in range(workers))
+    if metrics_port:
+        await registry.serve(metrics_host, metrics_port, routes={"/health": health_monitor.http_response})
+    if metrics_file:
+        tasks.append(asyncio.create_task(registry.export_file(metrics_file)))
+    health_monitor.start()
+    if role != "coordinator":
+        watchdog.start()
+    await pyrogram.idle()
+    stopping.set()
+    watchdog.stop()
+    health_monitor.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    speed_meter.stop()
+    await bot.stop()
+
 # تشغيل البوت
 if __name__ == "__main__":
     logger.info("Bot is starting...")
     try:
-        bot.run()
+        bot.run(main())
     finally:
-        if acc:
-            acc.stop()
-            logger.info("User session stopped.")
+        for session in account_pool.sessions:
+            session.client.stop()
+            logger.info(f"User session {session.name} stopped.")
@@ -0,0 +1,107 @@
+# ذاكرة مؤقتة لبيانات الدردشات: حالة الوصول، الـ peer المحلول، وتحويل اسم المستخدم إلى معرف
+# تمنع تكرار get_chat لكل رسالة في النطاق، مع تخزين سلبي قصير للدردشات التي لا يمكن الوصول إليها
+
+import asyncio
+import logging
+
+from cachetools import TTLCache
+from pyrogram.errors import FloodWait
+
+logger = logging.getLogger(__name__)
+
+
+class ChatCache:
+    # ttl: مدة صلاحية النتائج الناجحة، negative_ttl: مدة صلاحية الأخطاء
+    def __init__(self, ttl=3600, negative_ttl=60, maxsize=10000):
+        self._chats = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._errors = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        self._peers = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._usernames = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    # المفتاح يشمل اسم العميل لأن صلاحيات البوت وحساب المستخدم مختلفة
+    def _key(self, client, chatid):
+        if isinstance(chatid, str):
+            chatid = self._usernames.get(chatid.lower().lstrip("@"), chatid.lower().lstrip("@"))
+        return client.name, chatid
+
+    # جلب بيانات الدردشة من الذاكرة أو من تليجرام؛ الخطأ المخزن يعاد رفعه حتى تنتهي صلاحيته
+    async def get_chat(self, client, chatid):
+        key = self._key(client, chatid)
+        if key in self._chats:
+            self.hits += 1
+            return self._chats[key]
+        if key in self._errors:
+            self.hits += 1
+            raise self._errors[key]
+        # الطلبات المتزامنة لنفس الدردشة تنتظر استدعاء get_chat واحدا
+        if key in self._pending:
+            self.hits += 1
+            return await asyncio.shield(self._pending[key])
+        self.misses += 1
+        task = asyncio.ensure_future(self._fetch(client, chatid, key))
+        self._pending[key] = task
+
+        # الجلب المنتهي يحذف من الانتظار حتى لو ألغي من بدأه؛ النتيجة تبقى في _chats أو _errors فقط
+        def finished(_):
+            if self._pending.get(key) is task:
+                del self._pending[key]
+            if not task.cancelled():
+                task.exception()
+
+        task.add_done_callback(finished)
+        return await asyncio.shield(task)
+
+    async def _fetch(self, client, chatid, key):
+        try:
+            chat = await client.get_chat(chatid)
+        except FloodWait:
+            # FloodWait لا يعني انعدام الوصول فلا يخزن
+            raise
+        except Exception as e:
+            self._errors[key] = e
+            raise
+        self._chats[(client.name, chat.id)] = chat
+        if key != (client.name, chat.id):
+            self._chats[key] = chat
+        if chat.username:
+            self._usernames[chat.username.lower()] = chat.id
+        return chat
+
+    async def check_access(self, client, chatid):
+        try:
+            await self.get_chat(client, chatid)
+            return True
+        except Exception:
+            return False
+
+    async def resolve_peer(self, client, chatid):
+        key = self._key(client, chatid)
+        if key in self._peers:
+            self.hits += 1
+            return self._peers[key]
+        self.misses += 1
+        peer = await client.resolve_peer(chatid)
+        self._peers[key] = peer
+        return peer
+
+    # حذف كل ما يخص الدردشة بعد فشل جلب منها حتى تعاد قراءة حالتها
+    def invalidate(self, client, chatid):
+        key = self._key(client, chatid)
+        self._chats.pop(key, None)
+        self._errors.pop(key, None)
+        self._peers.pop(key, None)
+        self._pending.pop(key, None)
+        logger.info(f"Invalidated cached metadata for chat {chatid}")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "chats": len(self._chats),
+            "errors": len(self._errors),
+        }
@@ -0,0 +1,109 @@
+# تحميل متوازي للملفات الكبيرة: تقسيم الملف إلى مقاطع تحمل عبر عدة اتصالات في نفس الوقت
+# كل مقطع يكتب في موضعه داخل ملف محجوز مسبقا، والمقطع الفاشل يعاد تحميله وحده بدلا من إعادة الملف من البداية
+
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# وحدة الإزاحة في stream_media (1 ميجابايت)
+CHUNK_SIZE = 1024 * 1024
+
+
+# حجز مساحة الملف مسبقا؛ الملف الموجود يحتفظ بمحتواه لاستكمال التحميل
+def preallocate(path, size):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+    except OSError:
+        os.ftruncate(fd, size)
+    return fd
+
+
+# تقسيم الملف إلى مقاطع (رقم أول جزء، عدد الأجزاء)
+def segments(size, segment_chunks, chunk_size=CHUNK_SIZE):
+    total_chunks = (size + chunk_size - 1) // chunk_size
+    return [(start, min(segment_chunks, total_chunks - start)) for start in range(0, total_chunks, segment_chunks)]
+
+
+# fetch(offset, limit): مولد غير متزامن لأجزاء الملف (offset و limit بوحدة CHUNK_SIZE)
+# done: أرقام المقاطع المكتملة سابقا (للاستكمال)، on_segment(index): يستدعى عند اكتمال كل مقطع
+# should_retry(exc): يحدد الأخطاء التي يعاد فيها التحميل، والباقي يرفع مباشرة
+# كل اتصال يحمل نطاقا متصلا من المقاطع بتدفق واحد: كل استدعاء stream_media ينشئ جلسة جديدة
+# (ولملفات مراكز البيانات الأخرى مفتاحا وتفويضا جديدين)، فلا يفتح تدفق لكل مقطع
+# المقاطع تبقى وحدة الاستكمال، والفشل يستأنف من أول مقطع لم يكتمل في النطاق
+async def download_parallel(fetch, size, path, connections=4, segment_chunks=16, retries=3, retry_delay=2,
+                            done=(), on_segment=None, progress=None, should_retry=None, chunk_size=CHUNK_SIZE):
+    parts = segments(size, segment_chunks, chunk_size)
+    pending = [index for index in range(len(parts)) if index not in done]
+    completed = sum(count * chunk_size for index, (_, count) in enumerate(parts) if index in done)
+    fd = preallocate(path, size)
+
+    def segment_end(index):
+        start, count = parts[index]
+        return min(size, (start + count) * chunk_size)
+
+    # تحميل المقاطع المتتالية remaining بتدفق واحد؛ attempt يحمل بايتات المقطع الجاري حتى تلغى عند الفشل
+    async def fetch_run(remaining, attempt):
+        nonlocal completed
+        start = parts[remaining[0]][0]
+        position = start * chunk_size
+        end = segment_end(remaining[0])
+        async for data in fetch(start, sum(parts[index][1] for index in remaining)):
+            os.pwrite(fd, data, position)
+            position += len(data)
+            attempt["bytes"] += len(data)
+            completed += len(data)
+            if progress:
+                await progress(min(completed, size), size)
+            if position >= end:
+                if position != end:
+                    raise IOError(f"Segment {remaining[0]} ended at byte {position}, expected {end}")
+                index = remaining.pop(0)
+                attempt["bytes"] = 0
+                attempt["failures"] = 0
+                if on_segment:
+                    on_segment(index)
+                if not remaining:
+                    return
+                end = segment_end(remaining[0])
+        raise IOError(f"Segment {remaining[0]} ended at byte {position}, expected {end}")
+
+    async def worker(indexes):
+        nonlocal completed
+        # المقاطع المكتملة سابقا تقسم نصيب الاتصال إلى نطاقات متصلة
+        runs = []
+        for index in indexes:
+            if runs and runs[-1][-1] == index - 1:
+                runs[-1].append(index)
+            else:
+                runs.append([index])
+        for remaining in runs:
+            attempt = {"bytes": 0, "failures": 0}
+            while remaining:
+                try:
+                    await fetch_run(remaining, attempt)
+                except Exception as e:
+                    completed -= attempt["bytes"]
+                    attempt["bytes"] = 0
+                    attempt["failures"] += 1
+                    if attempt["failures"] >= retries or (should_retry and not should_retry(e)):
+                        raise
+                    logger.warning(f"Segment {remaining[0]} of {path} failed (attempt {attempt['failures']}/{retries}): {e}")
+                    await asyncio.sleep(retry_delay)
+
+    # تقسيم المقاطع المتبقية إلى نطاقات متصلة متساوية تقريبا، نطاق لكل اتصال
+    share = -(-len(pending) // max(1, connections)) or 1
+    workers = [asyncio.ensure_future(worker(pending[i:i + share])) for i in range(0, len(pending), share)]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        os.close(fd)
+    return path
@@ -0,0 +1,82 @@
+# ذاكرة دائمة تربط رسالة المصدر (chatid:msgid) بمعرف الملف file_id الذي حصل عليه البوت بعد الرفع
+# تسمح بإعادة إرسال الوسائط الشائعة دون تحميل أو رفع أي بايت
+
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class FileIdCache:
+    # max_entries: الحد الأقصى لعدد السجلات، max_age: عمر السجل بالثواني قبل حذفه
+    def __init__(self, path, max_entries=50000, max_age=30 * 24 * 3600):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids ("
+            " source TEXT PRIMARY KEY,"
+            " media_type TEXT NOT NULL,"
+            " file_id TEXT NOT NULL,"
+            " file_size INTEGER,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS file_ids_last_used ON file_ids (last_used)")
+        self._db.commit()
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evict()
+
+    @staticmethod
+    def key(chatid, msgid):
+        return f"{chatid}:{msgid}"
+
+    # يعيد (media_type, file_id) أو None إذا لم يوجد أو انتهت صلاحيته
+    def get(self, chatid, msgid):
+        now = time.time()
+        row = self._db.execute(
+            "SELECT media_type, file_id, created FROM file_ids WHERE source = ?", (self.key(chatid, msgid),)
+        ).fetchone()
+        if row is None or now - row[2] > self.max_age:
+            self.misses += 1
+            return None
+        self._db.execute("UPDATE file_ids SET last_used = ? WHERE source = ?", (now, self.key(chatid, msgid)))
+        self._db.commit()
+        self.hits += 1
+        return row[0], row[1]
+
+    def put(self, chatid, msgid, media_type, file_id, file_size=None):
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO file_ids (source, media_type, file_id, file_size, created, last_used)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (self.key(chatid, msgid), media_type, file_id, file_size, now, now)
+        )
+        self._db.commit()
+        self.evict()
+
+    def delete(self, chatid, msgid):
+        self._db.execute("DELETE FROM file_ids WHERE source = ?", (self.key(chatid, msgid),))
+        self._db.commit()
+
+    # حذف السجلات القديمة ثم الأقل استخداما إذا تجاوز العدد الحد الأقصى
+    def evict(self):
+        expired = self._db.execute("DELETE FROM file_ids WHERE created < ?", (time.time() - self.max_age,)).rowcount
+        overflow = self._db.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM file_ids WHERE source IN (SELECT source FROM file_ids ORDER BY last_used LIMIT ?)",
+                (overflow,)
+            )
+        self._db.commit()
+        if expired or overflow > 0:
+            logger.info(f"Evicted {expired} expired and {max(overflow, 0)} overflow file_id cache entries")
+
+    def stats(self):
+        count = self._db.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+        return {"entries": count, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,186 @@
+# مراقبة صحة البوت داخل العملية: تأخر حلقة الأحداث، الحمل، ومشاكل التشغيل (FloodWait، القرص، ...)
+# التقارير ترسل عند تغير الحالة، ومع استمرار مشكلة تعاد بفواصل متزايدة، بدلا من رسالة ثابتة كل بضع دقائق
+# ومراقب (Watchdog) يعيد تشغيل عمليات النقل التي توقف تقدمها، خاصة بعد توقف حلقة الأحداث
+
+import asyncio
+import json
+import logging
+import time
+import weakref
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    # state(): حالة المكونات الحالية، check(report): المشاكل الحالية {الاسم: الوصف}
+    # notify(text): إرسال التقرير، describe(report): ملخص الحالة في نص التقرير
+    # rate_keys: عدادات تراكمية في state يحسب معدلها في الثانية خلال آخر window ثانية
+    # stall_lag: تأخر الحلقة الذي يعتبر توقفا ويستدعى عنده on_stall(lag)
+    def __init__(self, state, check, notify=None, describe=None, interval=15, lag_interval=0.5, stall_lag=10,
+                 on_stall=None, rate_keys=(), window=300, backoff=600, max_backoff=6 * 3600):
+        self._state = state
+        self._check = check
+        self._notify = notify
+        self._describe = describe
+        self.interval = interval
+        self.lag_interval = lag_interval
+        self.stall_lag = stall_lag
+        self._on_stall = on_stall
+        self.rate_keys = tuple(rate_keys)
+        self.window = window
+        self.min_backoff = backoff
+        self.max_backoff = max_backoff
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.started = time.time()
+        self._samples = deque()
+        self._reported = None
+        self._notified_at = 0.0
+        self._backoff = backoff
+        self._tasks = []
+
+    # قياس تأخر الحلقة: الفرق بين مدة النوم المطلوبة والفعلية
+    async def _measure_lag(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.lag_interval)
+            self.lag = max(0.0, time.monotonic() - start - self.lag_interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            if self.lag >= self.stall_lag:
+                logger.error(f"Event loop stalled for {self.lag:.1f} seconds")
+                if self._on_stall:
+                    self._on_stall(self.lag)
+
+    # الحالة الكاملة مع المعدلات والمشاكل؛ sample يضيف العينة الحالية لحساب المعدلات
+    def report(self, sample=False):
+        state = dict(self._state())
+        now = time.monotonic()
+        if sample:
+            self._samples.append((now, {key: state.get(key, 0) for key in self.rate_keys}))
+            while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+                self._samples.popleft()
+        if len(self._samples) >= 2:
+            (first_at, first), (last_at, last) = self._samples[0], self._samples[-1]
+            for key in self.rate_keys:
+                state[f"{key}_per_second"] = (last[key] - first[key]) / (last_at - first_at) if last_at > first_at else 0.0
+        else:
+            for key in self.rate_keys:
+                state[f"{key}_per_second"] = 0.0
+        state["loop_lag"] = self.max_lag
+        state["uptime"] = time.time() - self.started
+        problems = self._check(state)
+        state["status"] = "degraded" if problems else "ok"
+        state["problems"] = problems
+        return state
+
+    def format(self, report, reminder=False):
+        lines = [f"Bot health: {report['status'].upper()}{' (still)' if reminder else ''}"]
+        lines.extend(f"- {description}" for description in report["problems"].values())
+        if self._describe:
+            lines.append(self._describe(report))
+        return "\n".join(lines)
+
+    # إرسال تقرير عند تغير مجموعة المشاكل، أو تذكير بفواصل متزايدة ما دامت المشكلة قائمة
+    async def _maybe_notify(self, report):
+        names = set(report["problems"])
+        now = time.monotonic()
+        reminder = names == self._reported
+        if reminder and not (names and now - self._notified_at >= self._backoff):
+            return
+        self._backoff = min(self._backoff * 2, self.max_backoff) if reminder else self.min_backoff
+        self._reported = names
+        self._notified_at = now
+        text = self.format(report, reminder)
+        (logger.warning if names else logger.info)(text.replace("\n", " | "))
+        if self._notify:
+            try:
+                await self._notify(text)
+            except Exception as e:
+                logger.warning(f"Failed to send health report: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                report = self.report(sample=True)
+                self.max_lag = self.lag
+                await self._maybe_notify(report)
+            except Exception as e:
+                logger.warning(f"Health check failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.ensure_future(self._measure_lag()), asyncio.ensure_future(self._run())]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    # استجابة نقطة /health: 200 عند السلامة و 503 عند وجود مشاكل
+    def http_response(self):
+        report = self.report()
+        status = "200 OK" if report["status"] == "ok" else "503 Service Unavailable"
+        return status, "application/json", json.dumps(report, default=str).encode()
+
+
+# إعادة تشغيل عمليات النقل المتوقفة؛ stalled(idle): مفاتيح النقل التي لم تتقدم منذ idle ثانية
+# كل مفتاح يربط بمهمة النقل عبر watch()، ومن يشغل المهمة يميز إلغاء المراقب بـ restarted(task) فيعيدها
+class Watchdog:
+    # timeout: مدة بلا تقدم قبل إعادة التشغيل، grace: المهلة بعد توقف الحلقة قبل فحص ما لم يستأنف
+    def __init__(self, stalled, timeout=300, interval=30, grace=30):
+        self._stalled = stalled
+        self.timeout = timeout
+        self.interval = interval
+        self.grace = grace
+        self._tasks = {}
+        self._restarted = weakref.WeakSet()
+        self._runner = None
+        self._after_stall = None
+        self.restarts = 0
+
+    def watch(self, key, task=None):
+        self._tasks[key] = task or asyncio.current_task()
+
+    def unwatch(self, key):
+        self._tasks.pop(key, None)
+
+    def restarted(self, task):
+        return task in self._restarted
+
+    def restart_stalled(self, idle):
+        for key in self._stalled(idle):
+            task = self._tasks.pop(key, None)
+            if task is None or task.done():
+                continue
+            logger.warning(f"Transfer {key} made no progress for {idle:.0f} seconds, restarting it")
+            self._restarted.add(task)
+            task.cancel()
+            self.restarts += 1
+
+    # بعد توقف الحلقة تتوقف كل عمليات النقل؛ تمنح مهلة grace لتستأنف ثم يعاد تشغيل ما لم يتقدم
+    def on_loop_stall(self, lag):
+        async def check():
+            await asyncio.sleep(self.grace)
+            self.restart_stalled(self.grace)
+
+        if self._after_stall is None or self._after_stall.done():
+            self._after_stall = asyncio.ensure_future(check())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.restart_stalled(self.timeout)
+            except Exception as e:
+                logger.error(f"Watchdog check failed: {e}")
+
+    def start(self):
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        for task in (self._runner, self._after_stall):
+            if task is not None:
+                task.cancel()
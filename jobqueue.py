@@ -0,0 +1,207 @@
+# طابور مهام غير متزامن لمعالجة نطاقات الرسائل بالتوازي
+# يحد من عدد العمليات المتزامنة لكل مستخدم وعلى مستوى البوت، ويحافظ على ترتيب الإرسال
+
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+# استثناء يرفع عند تجاوز المستخدم الحد الأقصى للمهام المعلقة
+class QueueFull(Exception):
+    pass
+
+
+# أدوار مرتبة: العنصر رقم i لا يدخل دوره إلا بعد انتهاء كل العناصر التي قبله
+# أحداث الانتظار تنشأ عند الحاجة فقط، فلا تتناسب الذاكرة مع طول النطاق
+class OrderedTurns:
+    def __init__(self):
+        self._finished = set()  # العناصر المنتهية بعد المقدمة
+        self._waiters = {}
+        self._next = 0
+
+    def turn(self, index):
+        return _Turn(self, index)
+
+    async def wait(self, index):
+        if self._next < index:
+            await self._waiters.setdefault(index, asyncio.Event()).wait()
+
+    # العنصر في المقدمة: كل العناصر التي قبله انتهت
+    def is_head(self, index):
+        return index == self._next
+
+    def release(self, index):
+        if index < self._next or index in self._finished:
+            return
+        self._finished.add(index)
+        while self._next in self._finished:
+            self._finished.discard(self._next)
+            self._next += 1
+            event = self._waiters.pop(self._next, None)
+            if event is not None:
+                event.set()
+
+
+class _Turn:
+    def __init__(self, turns, index):
+        self._turns = turns
+        self._index = index
+
+    # انتظار الدور دون إنهائه
+    async def wait(self):
+        await self._turns.wait(self._index)
+
+    def is_head(self):
+        return self._turns.is_head(self._index)
+
+    async def __aenter__(self):
+        await self.wait()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._turns.release(self._index)
+        return False
+
+
+# دور فارغ يستخدم عند المعالجة خارج الطابور
+class NoTurn:
+    async def wait(self):
+        pass
+
+    # لا توجد عناصر أخرى تنتظر هذا العنصر
+    def is_head(self):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+# حد تزامن يمكن تغيير قيمته أثناء التشغيل (بدلا من Semaphore ثابت)
+class _Limit:
+    def __init__(self, value):
+        self.value = value
+        self.active = 0
+        self._waiters = deque()
+
+    # تسليم المقاعد الحرة للمنتظرين بالترتيب مباشرة، حتى لا يسبقهم طلب جديد إليها
+    def _wake(self):
+        while self.active < self.value and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.active += 1
+                fut.set_result(None)
+
+    async def __aenter__(self):
+        if self.active < self.value and not self._waiters:
+            self.active += 1
+            return self
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # إذا سلم المقعد للمنتظر ثم ألغي ينتقل لمنتظر آخر
+            if fut.done() and not fut.cancelled():
+                self.active -= 1
+                self._wake()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.active -= 1
+        self._wake()
+        return False
+
+    def resize(self, value):
+        self.value = max(1, value)
+        self._wake()
+
+
+# مهمة نطاق واحدة لمستخدم معين
+class RangeJob:
+    def __init__(self, user_id, items):
+        self.user_id = user_id
+        self.items = list(items)
+        self.pending = len(self.items)
+        self.cancelled = False
+        self.tasks = []
+
+
+# الطابور: حد عام للعمليات المتزامنة + حد لكل مستخدم + حد لعدد المهام المعلقة لكل مستخدم
+class JobQueue:
+    def __init__(self, concurrency=4, per_user=2, max_jobs_per_user=3):
+        self._global = _Limit(concurrency)
+        self._per_user = per_user
+        self._max_jobs = max_jobs_per_user
+        self._user_slots = {}
+        self._jobs = {}
+
+    # عدد العناصر التي لم تنته بعد في كل المهام
+    def depth(self):
+        return sum(job.pending for jobs in self._jobs.values() for job in jobs)
+
+    @property
+    def concurrency(self):
+        return self._global.value
+
+    # تغيير الحد العام للعمليات المتزامنة؛ العمليات الجارية تكمل والتغيير يطبق على ما بعدها
+    def resize(self, concurrency):
+        if concurrency != self._global.value:
+            logger.info(f"Job concurrency changed from {self._global.value} to {concurrency}")
+        self._global.resize(concurrency)
+
+    def active_jobs(self, user_id=None):
+        if user_id is None:
+            return [job for jobs in self._jobs.values() for job in jobs]
+        return list(self._jobs.get(user_id, ()))
+
+    # إلغاء كل مهام المستخدم الجارية، ويعيد عدد المهام الملغاة
+    def cancel(self, user_id):
+        jobs = self._jobs.get(user_id, ())
+        for job in jobs:
+            job.cancelled = True
+            for task in job.tasks:
+                task.cancel()
+        logger.info(f"Cancelled {len(jobs)} job(s) for user {user_id}")
+        return len(jobs)
+
+    # تشغيل worker(item, turn) على كل العناصر؛ turn يضمن أن يتم إرسال كل عنصر بنفس ترتيب العناصر
+    async def run(self, user_id, items, worker):
+        jobs = self._jobs.setdefault(user_id, set())
+        if len(jobs) >= self._max_jobs:
+            if not jobs:
+                del self._jobs[user_id]
+            raise QueueFull(f"User {user_id} already has {len(jobs)} jobs in progress")
+
+        job = RangeJob(user_id, items)
+        jobs.add(job)
+        turns = OrderedTurns()
+        slots = self._user_slots.setdefault(user_id, asyncio.Semaphore(self._per_user))
+        pending = iter(enumerate(job.items))
+
+        async def worker_loop():
+            for index, item in pending:
+                try:
+                    async with slots, self._global:
+                        await worker(item, turns.turn(index))
+                except Exception as e:
+                    logger.error(f"Job item {item} for user {user_id} failed: {e}")
+                finally:
+                    turns.release(index)
+                    job.pending -= 1
+
+        job.tasks = [asyncio.create_task(worker_loop()) for _ in range(min(self._per_user, len(job.items)))]
+        try:
+            await asyncio.gather(*job.tasks, return_exceptions=True)
+        finally:
+            jobs.discard(job)
+            if not jobs:
+                self._jobs.pop(user_id, None)
+                self._user_slots.pop(user_id, None)
+        logger.info(f"Job for user {user_id} finished: {len(job.items)} item(s), cancelled={job.cancelled}")
+        return job
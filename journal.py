@@ -0,0 +1,129 @@
+# سجل دائم للمهام (SQLite) يبقى بعد إعادة التشغيل
+# يسجل كل مهمة نطاق، وحالة كل رسالة فيها، والمقاطع والبايتات المكتملة لكل ملف، ورسائل الحالة المؤقتة
+# عند التشغيل تستكمل المهام غير المكتملة وتنظف الملفات ورسائل الحالة اليتيمة
+
+import json
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " chat_id INTEGER NOT NULL,"
+            " message_id INTEGER NOT NULL,"
+            " user_id INTEGER,"
+            " link TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'running',"
+            " created REAL NOT NULL,"
+            " updated REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS items ("
+            " job_id INTEGER NOT NULL,"
+            " msgid INTEGER NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'pending',"
+            " PRIMARY KEY (job_id, msgid));"
+            "CREATE TABLE IF NOT EXISTS transfers ("
+            " source TEXT PRIMARY KEY,"
+            " path TEXT,"
+            " size INTEGER,"
+            " segments TEXT NOT NULL DEFAULT '[]',"
+            " bytes_done INTEGER NOT NULL DEFAULT 0,"
+            " status_chat_id INTEGER,"
+            " status_message_id INTEGER,"
+            " updated REAL NOT NULL);"
+        )
+        # المهام المنتهية التي بقيت من إصدارات سابقة كانت تحتفظ بها
+        self._db.execute("DELETE FROM jobs WHERE status != 'running'")
+        self._db.commit()
+
+    # بداية مهمة جديدة مع كل معرفات رسائلها
+    def start_job(self, chat_id, message_id, user_id, link, msgids):
+        now = time.time()
+        cursor = self._db.execute(
+            "INSERT INTO jobs (chat_id, message_id, user_id, link, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            (chat_id, message_id, user_id, link, now, now)
+        )
+        job_id = cursor.lastrowid
+        self._db.executemany("INSERT INTO items (job_id, msgid) VALUES (?, ?)", [(job_id, msgid) for msgid in msgids])
+        self._db.commit()
+        return job_id
+
+    def item_done(self, job_id, msgid, state="done"):
+        self._db.execute("UPDATE items SET state = ? WHERE job_id = ? AND msgid = ?", (state, job_id, msgid))
+        self._db.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+        self._db.commit()
+
+    # المهمة المنتهية لا يعاد تشغيلها فتحذف مع رسائلها حتى لا يكبر السجل مع كل رابط
+    def finish_job(self, job_id, status="done"):
+        logger.debug(f"Job {job_id} finished: {status}")
+        self._db.execute("DELETE FROM items WHERE job_id = ?", (job_id,))
+        self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        self._db.commit()
+
+    # المهام غير المكتملة مع المعرفات المتبقية في كل منها
+    def incomplete_jobs(self):
+        jobs = []
+        for job in self._db.execute("SELECT * FROM jobs WHERE status = 'running' ORDER BY id").fetchall():
+            pending = [row["msgid"] for row in self._db.execute(
+                "SELECT msgid FROM items WHERE job_id = ? AND state = 'pending' ORDER BY msgid", (job["id"],)
+            )]
+            jobs.append((dict(job), pending))
+        return jobs
+
+    # source يحدد عملية النقل (دردشة المستخدم:دردشة المصدر:معرف الرسالة)
+    def transfer_begin(self, source, status_chat_id, status_message_id):
+        self._db.execute(
+            "INSERT INTO transfers (source, status_chat_id, status_message_id, updated) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (source) DO UPDATE SET status_chat_id = excluded.status_chat_id,"
+            " status_message_id = excluded.status_message_id, updated = excluded.updated",
+            (source, status_chat_id, status_message_id, time.time())
+        )
+        self._db.commit()
+
+    def transfer_file(self, source, path, size):
+        self._db.execute(
+            "UPDATE transfers SET path = ?, size = ?, updated = ? WHERE source = ?", (path, size, time.time(), source)
+        )
+        self._db.commit()
+
+    # المقاطع المكتملة للملف إذا كان جزؤه المحمل ما زال على القرص
+    def transfer_segments(self, source, path):
+        row = self._db.execute("SELECT path, segments FROM transfers WHERE source = ?", (source,)).fetchone()
+        if row is None or row["path"] != path or not os.path.exists(path):
+            return set()
+        return set(json.loads(row["segments"]))
+
+    def segment_done(self, source, index, nbytes):
+        row = self._db.execute("SELECT segments FROM transfers WHERE source = ?", (source,)).fetchone()
+        if row is None:
+            return
+        segments = sorted(set(json.loads(row["segments"])) | {index})
+        self._db.execute(
+            "UPDATE transfers SET segments = ?, bytes_done = bytes_done + ?, updated = ? WHERE source = ?",
+            (json.dumps(segments), nbytes, time.time(), source)
+        )
+        self._db.commit()
+
+    def transfer_end(self, source):
+        self._db.execute("DELETE FROM transfers WHERE source = ?", (source,))
+        self._db.commit()
+
+    # عمليات النقل التي انقطعت قبل اكتمالها (لحذف رسائل الحالة والملفات اليتيمة)
+    def interrupted_transfers(self):
+        return [dict(row) for row in self._db.execute("SELECT * FROM transfers").fetchall()]
+
+    def clear_status_message(self, source):
+        self._db.execute(
+            "UPDATE transfers SET status_chat_id = NULL, status_message_id = NULL WHERE source = ?", (source,)
+        )
+        self._db.commit()
@@ -0,0 +1,96 @@
+# تحليل روابط تليجرام إلى مهام مهيكلة بنمط واحد مترجم مسبقا
+# يدعم روابط الرسائل العامة والخاصة (c/) والبوتات (b/) والنطاقات و ?single وروابط المواضيع وروابط الدعوة (+ و joinchat/)
+# والرسائل التي تحتوي عشرات أو مئات الروابط (سطر لكل رابط أو مفصولة بمسافات) تحلل في مرور واحد
+
+import re
+
+_LINK = re.compile(
+    r"(?:https?://)?(?:www\.)?(?:t|telegram)\.me/"
+    r"(?:"
+    r"(?:\+|joinchat/)(?P<invite>[\w-]+)"
+    r"|c/(?P<channel>\d+)/(?:\d+/)?(?P<c_first>\d+)(?:-(?P<c_last>\d+))?"
+    r"|b/(?P<bot>\w+)/(?P<b_first>\d+)(?:-(?P<b_last>\d+))?"
+    r"|(?P<username>[A-Za-z]\w+)/(?:\d+/)?(?P<first>\d+)(?:-(?P<last>\d+))?"
+    r")"
+    r"/?(?P<query>\?\S*)?",
+    re.IGNORECASE,
+)
+
+# أنواع المهام: join رابط دعوة، public قناة/مجموعة عامة، private قناة خاصة (c/)، bot محادثة بوت (b/)
+JOIN, PUBLIC, PRIVATE, BOT = "join", "public", "private", "bot"
+
+
+# مهمة واحدة: رابط دعوة، أو رسائل من دردشة واحدة (رسالة أو نطاق أو عدة روابط مجمعة)
+# single: نقل الرسالة المحددة فقط دون باقي ألبومها
+class LinkJob:
+    def __init__(self, kind, url, chat=None, msgids=(), single=False):
+        self.kind = kind
+        self.chat = chat
+        self.msgids = list(msgids)
+        self.single = single
+        self.urls = [url]
+
+    # الروابط الأصلية للمهمة؛ تحليلها من جديد يعيد نفس المهمة (تحفظ في السجل وطابور العمل)
+    @property
+    def text(self):
+        return "\n".join(self.urls)
+
+    @property
+    def url(self):
+        return self.urls[0]
+
+    def __repr__(self):
+        return f"LinkJob({self.kind}, chat={self.chat!r}, {len(self.msgids)} message(s), single={self.single})"
+
+
+# تحليل رابط واحد؛ يعيد None إذا لم يكن رابطا صالحا أو تجاوز نطاقه max_range رسالة
+def parse_link(token, max_range=None):
+    match = _LINK.fullmatch(token.strip())
+    if match is None:
+        return None
+    url = match.group(0)
+    if not url.lower().startswith(("http://", "https://")):
+        url = "https://" + url
+    if match["invite"]:
+        return LinkJob(JOIN, url)
+    if match["channel"]:
+        kind, chat, first, last = PRIVATE, int("-100" + match["channel"]), match["c_first"], match["c_last"]
+    elif match["bot"]:
+        kind, chat, first, last = BOT, match["bot"], match["b_first"], match["b_last"]
+    else:
+        kind, chat, first, last = PUBLIC, match["username"], match["first"], match["last"]
+    first = int(first)
+    last = int(last) if last else first
+    if last < first or (max_range and last - first + 1 > max_range):
+        return None
+    single = "single" in (match["query"] or "")
+    return LinkJob(kind, url, chat, range(first, last + 1), single)
+
+
+# تحليل نص كامل إلى مهام؛ روابط نفس الدردشة تجمع في مهمة واحدة حتى تجلب رسائلها على دفعات
+# حد max_range يطبق أيضا على مجموع المهمة المجمعة: الرابط الذي يتجاوزه يعد غير صالح
+# تعيد (المهام بترتيب أول ظهور، الأجزاء غير الصالحة)
+def parse_links(text, max_range=None):
+    jobs = {}
+    seen = {}  # معرفات كل مهمة مجمعة
+    invalid = []
+    for token in text.split():
+        job = parse_link(token, max_range)
+        if job is None:
+            invalid.append(token)
+            continue
+        key = (job.kind, job.url) if job.kind == JOIN else (job.kind, job.chat, job.single)
+        group = jobs.get(key)
+        if group is None:
+            jobs[key] = job
+            seen[key] = set(job.msgids)
+        elif job.kind != JOIN:
+            known = seen[key]
+            added = [msgid for msgid in job.msgids if msgid not in known]
+            if max_range and len(group.msgids) + len(added) > max_range:
+                invalid.append(token)
+                continue
+            known.update(added)
+            group.msgids.extend(added)
+            group.urls.append(job.url)
+    return list(jobs.values()), invalid
@@ -0,0 +1,185 @@
+# مقاييس بصيغة Prometheus النصية دون اعتماديات خارجية
+# عدادات ومقاييس لحظية ومدرجات تكرارية بتسميات (labels)، تعرض عبر نقطة HTTP محلية أو تكتب دوريا في ملف
+
+import asyncio
+import contextlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# حدود المدرج الافتراضية بالثواني (من 10 ميلي ثانية إلى 10 دقائق)
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    # تعيين القيمة مباشرة؛ تستخدمه المجمعات لنسخ عدادات المكونات الأخرى
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def clear(self):
+        self._values.clear()
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry["counts"][i] += 1
+        entry["sum"] += value
+        entry["count"] += 1
+
+    # قياس مدة الكتلة وتسجيلها حتى عند حدوث خطأ
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for key, entry in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, entry["counts"]):
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {count}"
+            yield f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {entry['count']}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {entry['sum']}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {entry['count']}"
+
+
+class Registry:
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(self.prefix + name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._add(Gauge(self.prefix + name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self.prefix + name, documentation, labels, buckets))
+
+    # collector(): دالة تحدث المقاييس اللحظية من حالة المكونات قبل كل عرض
+    def collector(self, func):
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.warning(f"Metrics collector {collect.__name__} failed: {e}")
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+    # نقطة HTTP بسيطة تعرض المقاييس على /metrics
+    # routes: مسارات إضافية {المسار: دالة تعيد (الحالة، نوع المحتوى، المحتوى)}
+    async def serve(self, host="127.0.0.1", port=9100, routes=None):
+        routes = dict(routes or {})
+
+        async def handle(reader, writer):
+            try:
+                request = await asyncio.wait_for(reader.readline(), 10)
+                while (await asyncio.wait_for(reader.readline(), 10)) not in (b"\r\n", b"\n", b""):
+                    pass
+                parts = request.decode("latin-1").split()
+                path = parts[1].split("?")[0] if len(parts) >= 2 else None
+                if path in ("/metrics", "/"):
+                    status, content_type, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", self.render().encode()
+                elif path in routes:
+                    status, content_type, body = routes[path]()
+                else:
+                    status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", b"Not Found\n"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+        return server
+
+    # كتابة المقاييس في ملف كل interval ثانية (لمجمع node_exporter textfile مثلا)
+    async def export_file(self, path, interval=15):
+        while True:
+            try:
+                temp = f"{path}.tmp"
+                with open(temp, "w") as f:
+                    f.write(self.render())
+                os.replace(temp, path)
+            except OSError as e:
+                logger.warning(f"Failed to write metrics file {path}: {e}")
+            await asyncio.sleep(interval)
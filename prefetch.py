@@ -0,0 +1,50 @@
+# قراءة مسبقة لنطاقات الرسائل: جلب المعرفات على دفعات مع تحميل النافذة التالية أثناء نقل العناصر الحالية
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# أقصى عدد معرفات يقبله get_messages في استدعاء واحد
+BATCH_SIZE = 200
+
+
+# تقسيم قائمة المعرفات إلى دفعات
+def batches(ids, size=BATCH_SIZE):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+class RangePrefetcher:
+    # load(ids): دالة تجلب مجموعة معرفات وتخزنها، ahead: عدد النوافذ التي تحمل مسبقا
+    def __init__(self, load, ids, window=BATCH_SIZE, ahead=1):
+        self._load = load
+        self._windows = list(batches(ids, window))
+        self._index = {msgid: i for i, ids in enumerate(self._windows) for msgid in ids}
+        self._tasks = {}
+        self._ahead = ahead
+
+    def _start(self, window):
+        if 0 <= window < len(self._windows) and window not in self._tasks:
+            task = asyncio.ensure_future(self._load(self._windows[window]))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._tasks[window] = task
+        return self._tasks.get(window)
+
+    # التأكد من تحميل نافذة المعرف وبدء تحميل النوافذ التالية في الخلفية
+    async def ensure(self, msgid):
+        window = self._index.get(msgid)
+        if window is None:
+            return
+        task = self._start(window)
+        for ahead in range(1, self._ahead + 1):
+            self._start(window + ahead)
+        try:
+            await asyncio.shield(task)
+        except Exception as e:
+            logger.warning(f"Prefetch of window {window} failed, falling back to single fetches: {e}")
+
+    def close(self):
+        for task in self._tasks.values():
+            task.cancel()
@@ -0,0 +1,100 @@
+# ناقل تقدم داخل العملية لعمليات التحميل والرفع
+# دالة التقدم تحدث العدادات في الذاكرة فقط، ومهمة واحدة على حلقة الأحداث تعدل رسائل الحالة بمعدل محدود
+
+import asyncio
+import logging
+import time
+
+from pyrogram.errors import FloodWait, MessageNotModified
+
+logger = logging.getLogger(__name__)
+
+LABELS = {"down": "Downloaded", "up": "Uploaded"}
+
+
+# حالة رسالة حالة واحدة
+class _Entry:
+    def __init__(self, chat_id, message_id):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.direction = None
+        self.current = 0
+        self.total = 0
+        self.sent_text = None
+        self.sent_at = 0.0
+        self.changed_at = time.monotonic()
+
+    def text(self):
+        if not self.direction or not self.total:
+            return None
+        return f"{LABELS.get(self.direction, self.direction)}: **{self.current * 100 / self.total:.1f}%**"
+
+
+class ProgressBus:
+    # interval: أقل مدة بين تعديلين لنفس الرسالة، edit_gap: أقل مدة بين أي تعديلين على مستوى البوت
+    def __init__(self, client, interval=10.0, edit_gap=1.0):
+        self._client = client
+        self._interval = interval
+        self._edit_gap = edit_gap
+        self._entries = {}
+        self._task = None
+
+    # تسجيل رسالة حالة؛ المفتاح (الدردشة، معرف رسالة الحالة) لأن معرفات الرسائل فريدة داخل الدردشة فقط
+    def watch(self, chat_id, message_id):
+        self._entries[(chat_id, message_id)] = _Entry(chat_id, message_id)
+        self._ensure_running()
+
+    def unwatch(self, key):
+        self._entries.pop(key, None)
+
+    def snapshot(self):
+        return {key: (entry.direction, entry.current, entry.total) for key, entry in self._entries.items()}
+
+    # عمليات النقل الجارية (بدأت ولم تكتمل) التي لم يتغير تقدمها منذ idle ثانية
+    def stalled(self, idle):
+        now = time.monotonic()
+        return [
+            key for key, entry in self._entries.items()
+            if entry.direction and entry.total and entry.current < entry.total and now - entry.changed_at >= idle
+        ]
+
+    # دالة التقدم التي يستدعيها Pyrogram؛ كونها async يجعلها تعمل على الحلقة نفسها بدون خيوط
+    async def callback(self, current, total, key, direction):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        if (direction, current) != (entry.direction, entry.current):
+            entry.changed_at = time.monotonic()
+        entry.direction = direction
+        entry.current = current
+        entry.total = total
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    # حلقة التعديل الوحيدة: تجمع التحديثات وتعدل الرسائل التي تغير نصها فقط
+    async def _run(self):
+        while self._entries:
+            edited = False
+            for key, entry in list(self._entries.items()):
+                text = entry.text()
+                if self._entries.get(key) is not entry or not text or text == entry.sent_text:
+                    continue
+                if time.monotonic() - entry.sent_at < self._interval:
+                    continue
+                try:
+                    await self._client.edit_message_text(entry.chat_id, entry.message_id, text)
+                except FloodWait as e:
+                    logger.warning(f"FloodWait while editing status message, waiting for {e.value} seconds")
+                    await asyncio.sleep(e.value)
+                except MessageNotModified:
+                    pass
+                except Exception as e:
+                    logger.error(f"Error editing status message {entry.message_id}: {e}")
+                entry.sent_text = text
+                entry.sent_at = time.monotonic()
+                edited = True
+                await asyncio.sleep(self._edit_gap)
+            if not edited:
+                await asyncio.sleep(1)
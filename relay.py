@@ -0,0 +1,54 @@
+# نقل مباشر (relay): تمرير أجزاء التحميل إلى الرفع عبر مخزن مؤقت محدود دون كتابة الملف على القرص
+# التحميل والرفع يعملان في نفس الوقت، والذاكرة المستخدمة ثابتة لكل عملية نقل
+
+import asyncio
+import math
+
+# حجم جزء الرفع الذي يقبله تليجرام (SaveBigFilePart)
+PART_SIZE = 512 * 1024
+
+
+# chunks: مولد غير متزامن لأجزاء التحميل بأي حجم
+# upload_part(index, total_parts, data): دالة رفع جزء واحد
+# progress(done_bytes, total_bytes): دالة تقدم اختيارية
+async def relay(chunks, total_size, upload_part, part_size=PART_SIZE, buffer_parts=8, uploaders=4, progress=None):
+    total_parts = math.ceil(total_size / part_size)
+    queue = asyncio.Queue(buffer_parts)
+    uploaded = 0
+
+    async def produce():
+        buf = bytearray()
+        index = 0
+        async for chunk in chunks:
+            buf += chunk
+            while len(buf) >= part_size:
+                await queue.put((index, bytes(buf[:part_size])))
+                del buf[:part_size]
+                index += 1
+        if buf:
+            await queue.put((index, bytes(buf)))
+            index += 1
+        if index != total_parts:
+            raise ValueError(f"Stream produced {index} parts, expected {total_parts}")
+        for _ in range(uploaders):
+            await queue.put(None)
+
+    async def consume():
+        nonlocal uploaded
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            index, data = item
+            await upload_part(index, total_parts, data)
+            uploaded += len(data)
+            if progress:
+                await progress(uploaded, total_size)
+
+    tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(consume()) for _ in range(uploaders)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return total_parts
@@ -0,0 +1,235 @@
+# مجدول مركزي للطلبات الصادرة من البوت وحساب المستخدم
+# ميزانية مستقلة لكل فئة طرق ولكل دردشة هدف، تتعلم من FloodWait بأسلوب AIMD
+# (زيادة خطية عند النجاح وتنصيف عند الحظر)، مع طابور أولويات يقدم ردود المستخدم على نقل النطاقات
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from collections import defaultdict
+
+from cachetools import TTLCache
+from pyrogram.errors import FloodWait
+
+logger = logging.getLogger(__name__)
+
+# مستويات الأولوية: الأصغر يخدم أولا
+INTERACTIVE = 0
+BULK = 1
+
+current_priority = contextvars.ContextVar("current_priority", default=INTERACTIVE)
+
+# فئة كل طريقة مجدولة؛ الطرق غير المذكورة تمر مباشرة دون جدولة
+METHOD_CLASSES = {
+    "send_message": "message",
+    "send_cached_media": "message",
+    "copy_message": "message",
+    "copy_media_group": "message",
+    "forward_messages": "message",
+    "delete_messages": "delete",
+    "edit_message_text": "edit",
+    "send_document": "upload",
+    "send_video": "upload",
+    "send_audio": "upload",
+    "send_voice": "upload",
+    "send_photo": "upload",
+    "send_animation": "upload",
+    "send_sticker": "upload",
+    "send_media_group": "upload",
+    "get_messages": "fetch",
+    "get_chat": "fetch",
+    "get_media_group": "fetch",
+    "resolve_peer": "fetch",
+    "download_media": "download",
+    "join_chat": "join",
+    "invoke": "raw",
+}
+
+# المعدل الابتدائي لكل فئة (طلب في الثانية)
+DEFAULT_RATES = {
+    "message": 20.0,
+    "edit": 5.0,
+    "delete": 20.0,
+    "upload": 5.0,
+    "fetch": 10.0,
+    "download": 5.0,
+    "join": 0.1,
+    "raw": 100.0,
+}
+
+# الفئات التي تملك ميزانية إضافية لكل دردشة
+CHAT_CLASSES = {"message", "edit", "upload", "fetch"}
+
+# معدل الإرسال لكل دردشة (تليجرام يسمح بحوالي رسالة في الثانية لكل دردشة)
+DEFAULT_CHAT_RATE = 1.0
+
+
+# ميزانية دلو رموز بمعدل متكيف وطابور انتظار حسب الأولوية
+class Budget:
+    def __init__(self, name, rate, burst=None):
+        self.name = name
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = rate / 16
+        self.max_rate = rate * 4
+        self.increase = rate / 50
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._pump_task = None
+
+    def queued(self):
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def acquire(self, level=INTERACTIVE):
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (level, next(self._seq), fut))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.ensure_future(self._pump())
+        await fut
+
+    # توزيع الرموز على المنتظرين بترتيب الأولوية
+    async def _pump(self):
+        while self._waiters:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                continue
+            self.tokens -= 1
+            fut.set_result(None)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    # block: إيقاف الميزانية كاملة لمدة الانتظار، وإلا يكتفى بتنصيف المعدل
+    def on_flood(self, seconds, block=True):
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+        if block:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RequestScheduler:
+    # max_wait: أطول FloodWait ينتظره المجدول قبل رفع الخطأ للمستدعي
+    def __init__(self, rates=None, chat_rate=DEFAULT_CHAT_RATE, max_retries=3, max_wait=300):
+        self.rates = dict(DEFAULT_RATES, **(rates or {}))
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self._budgets = {}
+        self._chat_budgets = TTLCache(maxsize=10000, ttl=600)
+        self._max_waits = {}
+        self._shares = {}
+        self.flood_counts = defaultdict(int)
+        self.flood_seconds = defaultdict(float)
+
+    # max_wait لكل عميل يسمح مثلا لجلسات المستخدمين برفع FloodWait مبكرا للانتقال إلى جلسة أخرى
+    # share: عدد العمليات التي تستخدم نفس الحساب، فيأخذ كل منها هذا الجزء من معدلات الفئات
+    def wrap(self, client, max_wait=None, share=1):
+        if max_wait is not None:
+            self._max_waits[client.name] = max_wait
+        self._shares[client.name] = share
+        return ScheduledClient(client, self)
+
+    def _budget(self, client_name, method_class):
+        key = (client_name, method_class)
+        if key not in self._budgets:
+            rate = self.rates[method_class] / self._shares.get(client_name, 1)
+            self._budgets[key] = Budget(f"{client_name}:{method_class}", rate)
+        return self._budgets[key]
+
+    def _chat_budget(self, client_name, chat_id):
+        key = (client_name, chat_id)
+        budget = self._chat_budgets.get(key)
+        if budget is None:
+            budget = Budget(f"{client_name}:{chat_id}", self.chat_rate, burst=3)
+            self._chat_budgets[key] = budget
+        return budget
+
+    @staticmethod
+    def _chat_of(args, kwargs):
+        if "chat_id" in kwargs:
+            return kwargs["chat_id"]
+        if args and isinstance(args[0], (int, str)):
+            return args[0]
+        return None
+
+    async def call(self, client, method, func, args, kwargs):
+        method_class = METHOD_CLASSES[method]
+        budget = self._budget(client.name, method_class)
+        chat = self._chat_of(args, kwargs) if method_class in CHAT_CLASSES else None
+        chat_budget = self._chat_budget(client.name, chat) if chat is not None else None
+        level = current_priority.get()
+
+        for attempt in itertools.count():
+            await budget.acquire(level)
+            if chat_budget is not None:
+                await chat_budget.acquire(level)
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWait as e:
+                self.flood_counts[method] += 1
+                self.flood_seconds[method] += e.value
+                logger.warning(f"FloodWait of {e.value} seconds on {client.name}.{method} (chat {chat})")
+                # الحظر الخاص بدردشة يوقف تلك الدردشة فقط ويخفض معدل الفئة
+                if chat_budget is not None:
+                    chat_budget.on_flood(e.value)
+                    budget.on_flood(e.value, block=False)
+                else:
+                    budget.on_flood(e.value)
+                if attempt >= self.max_retries or e.value > self._max_waits.get(client.name, self.max_wait):
+                    raise
+                continue
+            budget.on_success()
+            if chat_budget is not None:
+                chat_budget.on_success()
+            return result
+
+    # المدة المتبقية لحظر أي فئة من فئات العميل
+    def blocked_for(self, client_name):
+        now = time.monotonic()
+        return max(
+            (budget.blocked_until - now for (name, _), budget in self._budgets.items() if name == client_name),
+            default=0.0
+        )
+
+    def stats(self):
+        return {
+            "rates": {budget.name: budget.rate for budget in self._budgets.values()},
+            "queued": {budget.name: budget.queued() for budget in self._budgets.values()},
+            "flood_counts": dict(self.flood_counts),
+            "flood_seconds": dict(self.flood_seconds),
+        }
+
+
+# غلاف للعميل يمرر الطرق المعروفة عبر المجدول ويترك الباقي كما هو (on_message، run، stream_media ...)
+class ScheduledClient:
+    def __init__(self, client, scheduler):
+        self.__dict__["_client"] = client
+        self.__dict__["_scheduler"] = scheduler
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in METHOD_CLASSES or not callable(attr):
+            return attr
+
+        async def scheduled(*args, **kwargs):
+            return await self._scheduler.call(self._client, name, attr, args, kwargs)
+
+        return scheduled
+
+    def __setattr__(self, name, value):
+        setattr(self._client, name, value)
@@ -0,0 +1,122 @@
+# دمج العمليات المتطابقة الجارية: الطلبات المتزامنة لنفس المفتاح تشترك في تنفيذ واحد
+# النتيجة تبقى متاحة ما دام أحد المستخدمين يحملها، وتنظف (cleanup) عند تحرير آخر مستخدم لها
+# owner يحدد من ينفذ العمل (مثلا جلسة التحميل): فشل تنفيذ مالك آخر لا يرفع للمنضم بل يعيد التنفيذ بنفسه
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    def __init__(self, key, cleanup, owner):
+        self.key = key
+        self.cleanup = cleanup
+        self.owner = owner
+        self.task = None
+        self.users = 0
+        self.callbacks = []
+        self.aborted = False
+
+    # تمرير التقدم لكل المستخدمين المنتظرين
+    async def progress(self, current, total):
+        for callback in list(self.callbacks):
+            try:
+                await callback(current, total)
+            except Exception as e:
+                logger.warning(f"Progress callback for {self.key} failed: {e}")
+
+
+# استخدام واحد لنتيجة مشتركة؛ leader يعني أن هذا المستخدم هو من بدأ التنفيذ
+class Lease:
+    def __init__(self, group, flight, leader, progress):
+        self.group = group
+        self.flight = flight
+        self.leader = leader
+        self.result = None
+        self._progress = progress
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self._progress in self.flight.callbacks:
+            self.flight.callbacks.remove(self._progress)
+        self.group._release(self.flight)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+
+    # work(progress): ينفذ مرة واحدة لكل مفتاح؛ progress(current, total) يستقبل تقدم التنفيذ المشترك
+    # cleanup(result): يستدعى بعد تحرير آخر Lease لنتيجة ناجحة
+    # إذا أوقف التنفيذ المشترك بـ abort ينضم المنتظرون إلى تنفيذ جديد أو يبدؤونه
+    # وإذا فشل تنفيذ مالك آخر يبدأ المنضم تنفيذا جديدا بعمله هو، فلا تنسب إليه أخطاء غيره
+    async def acquire(self, key, work, progress=None, cleanup=None, owner=None):
+        while True:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight(key, cleanup, owner)
+                flight.task = asyncio.ensure_future(work(flight.progress))
+                flight.task.add_done_callback(lambda task, flight=flight: self._finished(flight))
+                self._flights[key] = flight
+            else:
+                logger.info(f"Joining in-flight transfer {key} ({flight.users} user(s) attached)")
+            flight.users += 1
+            if progress is not None:
+                flight.callbacks.append(progress)
+            lease = Lease(self, flight, leader, progress)
+            # الانتظار لا يلغي التنفيذ المشترك؛ إلغاء المستخدم نفسه يرفع هنا، وإيقاف التنفيذ بـ abort يظهر في مهمته
+            try:
+                await asyncio.wait([flight.task])
+            except BaseException:
+                lease.release()
+                raise
+            if flight.aborted and flight.task.cancelled():
+                lease.release()
+                continue
+            try:
+                lease.result = flight.task.result()
+            except Exception as e:
+                lease.release()
+                if not leader and flight.owner != owner:
+                    logger.info(f"In-flight transfer {key} by {flight.owner} failed ({e}), retrying with {owner}")
+                    continue
+                raise
+            except BaseException:
+                lease.release()
+                raise
+            return lease
+
+    # إيقاف التنفيذ المشترك الجاري (مثلا عند توقف تقدمه) حتى لو كان له مستخدمون آخرون
+    def abort(self, key):
+        flight = self._flights.get(key)
+        if flight is None or flight.task.done():
+            return False
+        logger.warning(f"Aborting in-flight transfer {key} ({flight.users} user(s) attached)")
+        del self._flights[key]
+        flight.aborted = True
+        flight.task.cancel()
+        return True
+
+    # التنفيذ الفاشل لا يشارك مع الطلبات الجديدة
+    def _finished(self, flight):
+        if (flight.task.cancelled() or flight.task.exception() is not None) and self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def _release(self, flight):
+        flight.users -= 1
+        if flight.users > 0:
+            return
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        if not flight.task.done():
+            flight.task.cancel()
+        elif not flight.task.cancelled() and flight.task.exception() is None and flight.cleanup:
+            try:
+                flight.cleanup(flight.task.result())
+            except Exception as e:
+                logger.error(f"Cleanup of {flight.key} failed: {e}")
@@ -0,0 +1,109 @@
+# قياس سرعة الانترنت في خيط عامل منفصل حتى لا تتوقف حلقة الأحداث أثناء القياس
+# القياسات المتزامنة تشترك في تشغيل واحد، والنتيجة تحفظ لفترة صلاحية، مع أخذ عينات دورية اختيارية
+
+import asyncio
+import logging
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import speedtest
+
+logger = logging.getLogger(__name__)
+
+
+class SpeedResult:
+    def __init__(self, download, upload, ping, measured_at=None):
+        self.download = download
+        self.upload = upload
+        self.ping = ping
+        self.measured_at = measured_at or time.time()
+
+    def age(self):
+        return time.time() - self.measured_at
+
+
+# قياس كامل متزامن (يستغرق 20-60 ثانية)، السرعات بالميجابت في الثانية
+def run_speedtest():
+    st = speedtest.Speedtest()
+    st.get_best_server()
+    download = st.download() / 1_000_000
+    upload = st.upload() / 1_000_000
+    return SpeedResult(download, upload, st.results.ping)
+
+
+class SpeedMeter:
+    # max_age: مدة صلاحية آخر نتيجة بالثواني، history: عدد العينات المحفوظة
+    def __init__(self, max_age=300, history=288, measure=run_speedtest):
+        self.max_age = max_age
+        self.history = deque(maxlen=history)
+        self._measure = measure
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speedtest")
+        self._inflight = None
+        self._sampler = None
+
+    @property
+    def latest(self):
+        return self.history[-1] if self.history else None
+
+    def fresh(self):
+        return self.latest is not None and self.latest.age() < self.max_age
+
+    def running(self):
+        return self._inflight is not None and not self._inflight.done()
+
+    # إرجاع النتيجة المحفوظة إن كانت صالحة، وإلا الانضمام للقياس الجاري أو بدء قياس جديد
+    async def measure(self, force=False):
+        if not force and self.fresh():
+            return self.latest
+        if not self.running():
+            self._inflight = asyncio.ensure_future(self._run())
+        return await asyncio.shield(self._inflight)
+
+    async def _run(self):
+        start = time.monotonic()
+        result = await asyncio.get_running_loop().run_in_executor(self._executor, self._measure)
+        self.history.append(result)
+        logger.info(
+            f"Speedtest finished in {time.monotonic() - start:.1f}s: "
+            f"down {result.download:.1f} Mbps, up {result.upload:.1f} Mbps, ping {result.ping:.1f} ms"
+        )
+        return result
+
+    # أخذ عينة كل interval ثانية؛ on_sample(result) يستدعى بعد كل عينة ناجحة
+    def start_sampler(self, interval, on_sample=None):
+        async def sample():
+            while True:
+                try:
+                    result = await self.measure(force=True)
+                    if on_sample:
+                        on_sample(result)
+                except Exception as e:
+                    logger.warning(f"Background speedtest failed: {e}")
+                await asyncio.sleep(interval)
+
+        if self._sampler is None or self._sampler.done():
+            self._sampler = asyncio.ensure_future(sample())
+
+    def stop(self):
+        if self._sampler is not None:
+            self._sampler.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # الوسيط لآخر samples عينات (تحميل، رفع) لتقليل أثر القياسات الشاذة
+    def throughput(self, samples=6):
+        recent = list(self.history)[-samples:]
+        if not recent:
+            return None
+        return statistics.median(r.download for r in recent), statistics.median(r.upload for r in recent)
+
+    # عدد النقلات المتزامنة المناسب لعرض النطاق، كل نقل يحتاج تقريبا per_transfer_mbps
+    def suggested_concurrency(self, per_transfer_mbps, minimum=1, maximum=None):
+        throughput = self.throughput()
+        if throughput is None:
+            return None
+        # كل نقل يحمل ثم يرفع، فالاتجاه الأبطأ هو المحدد
+        count = int(min(throughput) // per_transfer_mbps)
+        count = max(minimum, count)
+        return min(maximum, count) if maximum else count
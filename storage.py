@@ -0,0 +1,174 @@
+# إدارة مساحة التخزين المؤقت للتحميلات
+# كل تحميل يحجز حجمه المتوقع قبل البدء، وعند تجاوز المساحة الحرة أو الحصة ينتظر في طابور بدلا من الفشل بـ ENOSPC
+# مع منظف دوري يحذف الملفات اليتيمة القديمة
+
+import asyncio
+import itertools
+import logging
+import os
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# استثناء يرفع عندما لا يمكن توفير المساحة المطلوبة أبدا أو بعد انتظار طويل
+class InsufficientStorage(Exception):
+    pass
+
+
+class Reservation:
+    def __init__(self, manager, size, name):
+        self.manager = manager
+        self.size = size
+        self.name = name
+        self.path = None
+
+    # الجزء الذي لم يكتب بعد على القرص من المساحة المحجوزة
+    def outstanding(self):
+        written = 0
+        if self.path:
+            try:
+                written = os.path.getsize(self.path)
+            except OSError:
+                pass
+        return max(0, self.size - written)
+
+
+class StorageManager:
+    # quota: أقصى مجموع للحجوزات (0 بلا حد)، min_free: المساحة التي تبقى حرة دائما على القرص
+    # orphan_age: عمر الملف غير المحجوز قبل أن يعتبر يتيما، protected(): مسارات لا يحذفها المنظف
+    def __init__(self, directory, quota=0, min_free=1024 ** 3, max_wait=1800, orphan_age=3600, protected=None):
+        self.directory = directory
+        self.quota = quota
+        self.min_free = min_free
+        self.max_wait = max_wait
+        self.orphan_age = orphan_age
+        self._protected = protected
+        self._reservations = set()
+        self._waiters = {}
+        self._seq = itertools.count()
+        self._sweeper = None
+        os.makedirs(directory, exist_ok=True)
+
+    def reserved(self):
+        return sum(r.size for r in self._reservations)
+
+    def free(self):
+        return shutil.disk_usage(self.directory).free
+
+    # المساحة الحرة بعد خصم ما لم يكتب بعد من الحجوزات
+    def headroom(self):
+        return self.free() - sum(r.outstanding() for r in self._reservations)
+
+    # head: الحجز لعنصر يقف أمامه باقي عناصر المهمة، فيسمح له باستخدام هامش min_free والحصة
+    # حتى لا تنتظر العناصر التالية (التي تحمل حجوزاتها) عنصرا لا يجد مساحة
+    def _fits(self, size, head=False):
+        available = self.headroom()
+        if head:
+            return size <= available
+        if self.quota and self.reserved() + size > self.quota:
+            return False
+        return size <= available - self.min_free
+
+    # حجز size بايت؛ on_wait() يستدعى مرة واحدة إذا اضطر الطلب للانتظار
+    # is_head(): دالة اختيارية تخبر إن كان الطلب أصبح في مقدمة مهمته
+    async def reserve(self, size, name=None, on_wait=None, is_head=None):
+        size = size or 0
+        if self.quota and size > self.quota:
+            raise InsufficientStorage(f"File of {size} bytes exceeds the storage quota of {self.quota} bytes")
+        if size > shutil.disk_usage(self.directory).total - self.min_free:
+            raise InsufficientStorage(f"File of {size} bytes cannot fit on the download disk")
+
+        start = time.monotonic()
+        seq = next(self._seq)
+        waited = False
+        try:
+            while True:
+                # الأقدم في الطابور يخدم أولا، إلا عنصر مقدمة المهمة فلا ينتظر غيره
+                head = bool(is_head and is_head())
+                first = not self._waiters or min(self._waiters) == seq
+                if (first or head) and self._fits(size, head):
+                    break
+                if not waited:
+                    waited = True
+                    logger.info(f"Waiting for {size} bytes of disk space for {name} ({self.reserved()} reserved)")
+                    if on_wait:
+                        await on_wait()
+                if time.monotonic() - start > self.max_wait:
+                    raise InsufficientStorage(f"Timed out waiting for {size} bytes of disk space")
+                event = self._waiters.setdefault(seq, asyncio.Event())
+                event.clear()
+                # إعادة الفحص دوريا لأن المساحة الحرة قد تتغير من خارج البوت
+                try:
+                    await asyncio.wait_for(event.wait(), 5)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiters.pop(seq, None)
+            self._wake()
+
+        reservation = Reservation(self, size, name)
+        self._reservations.add(reservation)
+        return reservation
+
+    def _wake(self):
+        for event in self._waiters.values():
+            event.set()
+
+    def release(self, reservation):
+        if reservation in self._reservations:
+            self._reservations.discard(reservation)
+            self._wake()
+
+    # حذف الملفات غير المحجوزة وغير المحمية التي لم تعدل منذ orphan_age ثانية
+    def sweep(self):
+        keep = {r.path for r in self._reservations if r.path}
+        if self._protected:
+            keep |= set(self._protected())
+        removed = freed = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.path in keep:
+                continue
+            try:
+                stat = entry.stat()
+                if now - stat.st_mtime < self.orphan_age:
+                    continue
+                os.remove(entry.path)
+                removed += 1
+                freed += stat.st_size
+            except OSError as e:
+                logger.warning(f"Failed to remove orphaned file {entry.path}: {e}")
+        if removed:
+            logger.info(f"Storage sweep removed {removed} orphaned file(s), freed {freed} bytes")
+            self._wake()
+        return removed
+
+    def start_sweeper(self, interval=600):
+        async def run():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Storage sweep failed: {e}")
+
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.ensure_future(run())
+
+    def usage(self):
+        files = size = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                files += 1
+                size += entry.stat().st_size
+        return {
+            "reserved": self.reserved(),
+            "reservations": len(self._reservations),
+            "waiting": len(self._waiters),
+            "files": files,
+            "bytes_on_disk": size,
+            "free": self.free(),
+            "quota": self.quota,
+        }
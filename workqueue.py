@@ -0,0 +1,169 @@
+# طابور عمل دائم (SQLite) مشترك بين عملية الاستقبال (coordinator) وعمليات التنفيذ (workers)
+# كل عامل يستلم المهمة بعقد مؤقت (lease) يجدده دوريا؛ إذا توقف العامل ينتهي العقد وتستلمها عملية أخرى
+# مع حفظ الرسائل المكتملة حتى لا يعاد إرسالها
+
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WorkQueue:
+    # lease: مدة العقد بالثواني، max_attempts: عدد مرات الاستلام قبل اعتبار المهمة فاشلة (مهمة تسقط العامل)
+    def __init__(self, path, lease=60, max_attempts=3):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lease = lease
+        self.max_attempts = max_attempts
+        # isolation_level=None: المعاملات تدار صراحة بـ BEGIN IMMEDIATE لأن عدة عمليات تكتب في نفس الملف
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS work ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " kind TEXT NOT NULL,"
+            " user_id INTEGER NOT NULL,"
+            " chat_id INTEGER NOT NULL,"
+            " message_id INTEGER NOT NULL,"
+            " text TEXT NOT NULL,"
+            " target TEXT,"
+            " status TEXT NOT NULL DEFAULT 'queued',"
+            " worker TEXT,"
+            " lease_until REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " cancelled INTEGER NOT NULL DEFAULT 0,"
+            " done TEXT NOT NULL DEFAULT '[]',"
+            " created REAL NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS work_status ON work (status, id)")
+
+    # معاملة كتابة تحجز القاعدة من البداية حتى لا تستلم عمليتان نفس المهمة
+    @contextlib.contextmanager
+    def _transaction(self):
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _write(self, sql, params=()):
+        return self._db.execute(sql, params).rowcount
+
+    # target: اسم عامل محدد (مثلا لروابط الانضمام التي يجب أن تنفذها كل العمليات)
+    def enqueue(self, kind, user_id, chat_id, message_id, text, target=None):
+        now = time.time()
+        cursor = self._db.execute(
+            "INSERT INTO work (kind, user_id, chat_id, message_id, text, target, created, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, user_id, chat_id, message_id, text, target, now, now)
+        )
+        return cursor.lastrowid
+
+    # استلام أقدم مهمة متاحة: في الطابور أو انتهى عقدها
+    # مهام المستخدم الواحد تبقى في عامل واحد حتى يبقى ترتيب الإرسال وحدود المستخدم وسرعة الدردشة صحيحة
+    # per_user: أقصى عدد من مهام المستخدم الجارية معا (رسالة بعدة روابط تضع عدة مهام)
+    def claim(self, worker, per_user=None):
+        now = time.time()
+        with self._transaction():
+            while True:
+                row = self._db.execute(
+                    "SELECT * FROM work WHERE (status = 'queued' OR (status = 'leased' AND lease_until < ?))"
+                    " AND (target IS NULL OR target = ?)"
+                    " AND (kind != 'link' OR user_id NOT IN (SELECT user_id FROM work WHERE kind = 'link' AND status = 'leased'"
+                    " AND worker != ? AND lease_until >= ?))"
+                    " AND (? IS NULL OR kind != 'link' OR user_id NOT IN (SELECT user_id FROM work WHERE kind = 'link'"
+                    " AND status = 'leased' AND lease_until >= ? GROUP BY user_id HAVING COUNT(*) >= ?))"
+                    " ORDER BY id LIMIT 1",
+                    (now, worker, worker, now, per_user, now, per_user)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["status"] == "leased":
+                    logger.warning(f"Reclaiming work {row['id']} from {row['worker']} (lease expired)")
+                if row["attempts"] >= self.max_attempts:
+                    logger.error(f"Work {row['id']} failed after {row['attempts']} attempts")
+                    self._write("UPDATE work SET status = 'failed', updated = ? WHERE id = ?", (now, row["id"]))
+                    continue
+                self._write(
+                    "UPDATE work SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, updated = ?"
+                    " WHERE id = ?",
+                    (worker, now + self.lease, now, row["id"])
+                )
+                row = dict(row)
+                row["done"] = json.loads(row["done"])
+                return row
+
+    # تجديد عقود مهام العامل؛ تعيد {id: cancelled} للمهام التي ما زالت له
+    def renew(self, worker, ids):
+        if not ids:
+            return {}
+        now = time.time()
+        marks = ",".join("?" * len(ids))
+        self._write(
+            f"UPDATE work SET lease_until = ?, updated = ? WHERE status = 'leased' AND worker = ? AND id IN ({marks})",
+            (now + self.lease, now, worker, *ids)
+        )
+        rows = self._db.execute(
+            f"SELECT id, cancelled FROM work WHERE status = 'leased' AND worker = ? AND id IN ({marks})", (worker, *ids)
+        ).fetchall()
+        return {row["id"]: bool(row["cancelled"]) for row in rows}
+
+    def item_done(self, work_id, msgid):
+        with self._transaction():
+            row = self._db.execute("SELECT done FROM work WHERE id = ?", (work_id,)).fetchone()
+            if row is not None:
+                done = sorted(set(json.loads(row["done"])) | {msgid})
+                self._write("UPDATE work SET done = ?, updated = ? WHERE id = ?", (json.dumps(done), time.time(), work_id))
+
+    def finish(self, work_id, worker, status="done"):
+        self._write(
+            "UPDATE work SET status = ?, lease_until = NULL, updated = ? WHERE id = ? AND worker = ?",
+            (status, time.time(), work_id, worker)
+        )
+
+    # إعادة مهام العامل إلى الطابور (عند إيقافه أو إعادة تشغيله) حتى تستلم فورا دون انتظار انتهاء العقد
+    # crashed: العامل يبدأ بعد سقوطه، فتبقى المحاولة محسوبة حتى لا تسقطه نفس المهمة بلا نهاية
+    def release_worker(self, worker, crashed=False):
+        count = self._write(
+            "UPDATE work SET status = 'queued', worker = NULL, lease_until = NULL,"
+            " attempts = CASE WHEN ? THEN attempts ELSE MAX(attempts - 1, 0) END,"
+            " updated = ? WHERE status = 'leased' AND worker = ?",
+            (crashed, time.time(), worker)
+        )
+        if count:
+            logger.info(f"Returned {count} work item(s) of {worker} to the queue")
+        return count
+
+    # إلغاء مهام المستخدم: المنتظرة تلغى مباشرة والجارية تعلم ليوقفها عاملها عند التجديد
+    def cancel_user(self, user_id):
+        now = time.time()
+        with self._transaction():
+            queued = self._write(
+                "UPDATE work SET status = 'cancelled', updated = ? WHERE status = 'queued' AND user_id = ?", (now, user_id)
+            )
+            running = self._write(
+                "UPDATE work SET cancelled = 1, updated = ? WHERE status = 'leased' AND user_id = ?", (now, user_id)
+            )
+        return queued + running
+
+    # عدد مهام المستخدم غير المنتهية (روابط الانضمام لا تحسب)
+    def active(self, user_id):
+        return self._db.execute(
+            "SELECT COUNT(*) FROM work WHERE kind = 'link' AND user_id = ? AND status IN ('queued', 'leased')", (user_id,)
+        ).fetchone()[0]
+
+    def counts(self):
+        return dict(self._db.execute("SELECT status, COUNT(*) FROM work GROUP BY status").fetchall())
+
+    # حذف المهام المنتهية الأقدم من max_age ثانية
+    def purge(self, max_age=86400):
+        return self._write(
+            "DELETE FROM work WHERE status NOT IN ('queued', 'leased') AND updated < ?", (time.time() - max_age,)
+        )